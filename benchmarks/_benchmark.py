@@ -3,17 +3,156 @@ Utilities for doing benchmarks.
 """
 
 import gc
+import os
+import ast
+import json
 import time
+import asyncio
+import inspect
+import itertools
+import tracemalloc
 
 import numpy as np
+import wgpu
 from wgpu.gui.offscreen import WgpuCanvas as OffscreenWgpuCanvas, run
 import pygfx as gfx
 
-gfx.renderers.wgpu.enable_wgpu_features("timestamp-query")
+from _stats import summarize, relative_ci_width, has_trend
+from _store import DEFAULT_STORE, new_run_id, create_record, append_record
+from _memory import (
+    get_rss,
+    get_max_rss,
+    get_gpu_memory,
+    get_object_counts,
+    find_growing,
+)
+from _profile import Profiler
+from _environment import get_interference
 
 
-def benchmark(func):
-    """Decorator for benchmark functions."""
+def _enable_timestamp_query():
+    # Only request the feature if the adapter has it, because requesting
+    # a device with an unsupported feature fails (e.g. on lavapipe).
+    try:
+        adapter = wgpu.gpu.request_adapter(power_preference="high-performance")
+        if "timestamp-query" not in adapter.features:
+            return False
+    except Exception:
+        return False
+    gfx.renderers.wgpu.enable_wgpu_features("timestamp-query")
+    return True
+
+
+HAS_TIMESTAMP_QUERY = _enable_timestamp_query()
+
+
+# Options that affect how benchmarks are run. Use configure() to change these.
+config = {
+    # Keep iterating until the 95% CI of the median cpu time is within
+    # this fraction of the median (e.g. 0.02 for ±2%). None means use a
+    # fixed number of iterations.
+    "target_ci": None,
+    # The max time in seconds to spend on measurements when target_ci is set,
+    # and overrides per benchmark case id (e.g. set by the runner's scheduler).
+    "time_budget": 10.0,
+    "time_budgets": {},
+    # The max number of iterations when target_ci is set.
+    "max_timings": 100_000,
+    # The number of warmup iterations. None means warm up until the timings
+    # of the last warmup_window iterations no longer trend up or down.
+    "warmup": None,
+    "warmup_window": 10,
+    # The max number of warmup iterations, and max time in seconds for warmup.
+    "max_warmup": 200,
+    "max_warmup_time": 5.0,
+    # The JSON Lines file to write results to. None means don't store results.
+    "store": DEFAULT_STORE,
+    # The id shared by all results of this run.
+    "run_id": new_run_id(),
+    # Whether to record memory use (Python heap, RSS, wgpu objects) for each
+    # iteration. Note that tracing the Python heap makes the code slower.
+    "memory": False,
+    # A directory to write profiles of the timed region to. None means don't
+    # profile. Note that profiling makes the code slower.
+    "profile": None,
+    # Whether to disable the garbage collector in the timed region, and
+    # collect between iterations instead (the time for that is reported as
+    # "gc"). Objects that exist before measuring are frozen, so that they
+    # don't add to the time of these collections.
+    "controlled": False,
+    # Whether to drop iterations that were interrupted by other processes
+    # (involuntary context switches or major page faults) from the results.
+    # Such iterations are always counted and reported.
+    "reject_noisy": False,
+    # The wgpu device that get_device() returns in benchmarks: the same
+    # device for all benchmarks ("shared"), a new device and canvas for each
+    # benchmark ("fresh"), or a device from a pool of devices that earlier
+    # benchmarks left without live objects ("pooled").
+    "device": "shared",
+    # The max bytes of input arrays to keep cached (see _fixtures.py), and a
+    # directory to store large arrays in as memory-mapped .npy files. None
+    # means keep them in memory.
+    "fixture_budget": 2 * 2**30,
+    "fixture_dir": None,
+    # Whether to write each record to stdout (prefixed with RECORD_PREFIX),
+    # so that a parent process can collect them.
+    "stream": False,
+}
+
+RECORD_PREFIX = "@@benchmark-record "
+
+
+def configure(**kwargs):
+    """Set options for running benchmarks (see ``config``)."""
+    for key, val in kwargs.items():
+        if key not in config:
+            raise KeyError(f"Invalid benchmark config option: {key!r}")
+        config[key] = val
+
+
+def benchmark(
+    func=None,
+    *,
+    tags=(),
+    kind=None,
+    params=None,
+    params_mode="product",
+    nbytes=None,
+):
+    """Decorator for benchmark functions.
+
+    Can be used as ``@benchmark``, ``@benchmark(n_timings)``, and
+    ``@benchmark(n_timings, tags=["upload"])``. The tags can be used
+    to select benchmarks with the runner. The module name (without the
+    "bm_" prefix) is implicitly added as a tag.
+
+    The kind is "cpu" for benchmarks that don't use the GPU in the timed
+    region, and "gpu" otherwise. CPU benchmarks can be run in parallel by
+    the runner. If not given, the kind is detected from the source code.
+
+    The params is a dict that maps argument names to lists of values.
+    The benchmark is run for each combination of values (or, with
+    ``params_mode="zip"``, for the values at the same positions), and the
+    function receives them as keyword arguments. A tuple of names can be
+    used as a key to vary these arguments together. Instead of a list, a dict
+    can be given that maps labels to values, e.g. for values that are not
+    simple numbers or strings. Each case gets an id like
+    ``name/n_objects=10,n_verts=100``, which can be used to select it.
+
+    The function can also be (or return) an async generator, which is then
+    driven by an event loop. Besides the wall time ("cpu"), the CPU time
+    of the process is reported ("busy"), so that the time spent awaiting
+    the GPU can be told apart.
+
+    The nbytes is the number of bytes that an iteration processes (e.g.
+    uploads). If given, the sustained throughput over all iterations is
+    reported in GB/s. This includes the time to close the generator, so
+    that a benchmark can finish work that is still in flight (e.g. in a
+    ``finally`` clause) and have it counted.
+    """
+    if kind not in (None, "cpu", "gpu"):
+        raise ValueError(f"Invalid benchmark kind: {kind!r}")
+    cases, label_maps = expand_params(params or {}, params_mode)
 
     if isinstance(func, int):
         n_timings = func
@@ -22,81 +161,722 @@ def benchmark(func):
 
     def outer(func):
 
-        def inner(*args):
+        def inner(*args, **case):
 
             # Do somewhat of a reset
             for _ in range(3):
                 gc.collect()
                 time.sleep(0.02)
 
-            # Boot the generator.
-            generator = func(*args)
+            t_begin = time.perf_counter()
+
+            memory = None
+            if config["memory"]:
+                memory = {"traced": [], "traced_peak": [], "rss": []}
+                started_tracemalloc = not tracemalloc.is_tracing()
+                if started_tracemalloc:
+                    tracemalloc.start()
+
+            # Prepare the device and canvas, and take note of the live wgpu
+            # objects, to check that the benchmark releases what it creates.
+            objects_before = get_object_counts()
+            _devices.update(active=True, current=None, startup_ns=0)
+            # The device, the event loop of async benchmarks, GC and tracemalloc
+            # are restored even if the benchmark raises (e.g. in its setup),
+            # so that it does not affect the next.
+            generator = None
+            controlled = config["controlled"]
+            gc_was_enabled = gc.isenabled()
+            try:
+                # The canvas is not counted in the startup, only the device
+                if config["device"] == "fresh" and args:
+                    args = (OffscreenWgpuCanvas(),) + args[1:]
+
+                # Boot the generator.
+                _gpu_timed_renderers.clear()
+                case_id = get_case_id(name, case)
+                values = {}
+                for k, v in case.items():
+                    if k in label_maps and isinstance(v, str):
+                        v = label_maps[k].get(v, v)
+                    values[k] = v
+                generator = func(*args, **values)
+                if inspect.isasyncgen(generator):
+                    generator = AsyncGeneratorRunner(generator)
 
-            # Seed: the generator does its preparations.
-            generator.__next__()
+                # Seed: the generator does its preparations.
+                generator.__next__()
+                params = get_generator_params(generator)
+                params.update(case)
 
-            # Do a few warmup iters. In practice the first iter or two tends to take more time than the rest.
-            generator.__next__()
-            extra_times = generator.__next__()
+                # Warm up. The first iter is usually much slower (e.g. compiling
+                # shaders and pipelines), and it can take more iters until caches
+                # and allocators settle. The first iter is reported separately.
+                first_ns, n_warmup = warmup(generator)
 
-            time_keys = ["cpu"]
-            if extra_times is not None:
-                time_keys.extend(extra_times.keys())
+                # Do measurements
+                times_ns = {"cpu": []}
+                interference = {"involuntary": [], "voluntary": [], "faults": []}
+                n_noisy = n_rejected = 0
+                profiler = Profiler() if config["profile"] else None
+                if memory is not None:
+                    tracemalloc.reset_peak()
 
-            # Do measurements
-            times_ns = {k: [] for k in time_keys}
-            for iter in range(n_timings):
-                # time.sleep(0) # so weird, if I sleep for 0.1, some tests take longer??
+                def measure(n):
+                    nonlocal n_noisy, n_rejected
+                    n_target = len(times_ns["cpu"]) + n
+                    for iter in range(3 * n):  # room for rejected iterations
+                        if len(times_ns["cpu"]) >= n_target:
+                            break
+                        # time.sleep(0) # so weird, if I sleep for 0.1, some tests take longer??
+                        if profiler is not None:
+                            profiler.enable()
+                        usage0 = get_interference()
+                        b0 = time.process_time_ns()
+                        t0 = time.perf_counter_ns()
+                        extra_times = generator.__next__()
+                        t1 = time.perf_counter_ns()
+                        b1 = time.process_time_ns()
+                        usage1 = get_interference()
+                        if profiler is not None:
+                            profiler.disable()
+                        if controlled:
+                            t2 = time.perf_counter_ns()
+                            gc.collect()
+                            gc_ns = time.perf_counter_ns() - t2
+                        if usage0 is not None:
+                            delta = [b - a for a, b in zip(usage0, usage1)]
+                            if delta[0] or delta[3]:
+                                n_noisy += 1
+                                if config["reject_noisy"]:
+                                    n_rejected += 1
+                                    continue
+                            interference["involuntary"].append(delta[0])
+                            interference["voluntary"].append(delta[1])
+                            interference["faults"].append(delta[2])
+                        if controlled:
+                            times_ns.setdefault("gc", []).append(gc_ns)
+                        times_ns["cpu"].append((t1 - t0))
+                        times_ns.setdefault("busy", []).append(b1 - b0)
+                        if extra_times:
+                            for k, t in extra_times.items():
+                                times_ns.setdefault(k, []).append(t)
+                        for renderer in _gpu_timed_renderers:
+                            for k, t in get_gpu_times(renderer).items():
+                                times_ns.setdefault(k, []).append(t)
+                        if memory is not None:
+                            current, peak = tracemalloc.get_traced_memory()
+                            tracemalloc.reset_peak()
+                            memory["traced"].append(current)
+                            memory["traced_peak"].append(peak)
+                            memory["rss"].append(get_rss())
+                            for k, v in get_gpu_memory().items():
+                                memory.setdefault(k, []).append(v)
+
+                # In controlled mode, GC is disabled while measuring.
+                if controlled:
+                    gc.collect()
+                    gc.freeze()
+                    gc.disable()
+                t_start = time.perf_counter()
+                measure(n_timings)
+
+                # Optionally continue until the result is stable enough
+                target_ci = config["target_ci"]
+                if target_ci:
+                    time_budget = config["time_budgets"].get(
+                        case_id, config["time_budget"]
+                    )
+                    max_timings = config["max_timings"]
+                    while True:
+                        n = len(times_ns["cpu"])
+                        elapsed = time.perf_counter() - t_start
+                        if n >= max_timings or elapsed >= time_budget:
+                            break
+                        elif relative_ci_width(times_ns["cpu"]) <= target_ci:
+                            break
+                        # Grow by 50%, but not beyond the limits
+                        n_extra = max(1, n // 2)
+                        n_extra = min(n_extra, max_timings - n)
+                        time_per_iter = elapsed / n
+                        n_extra = min(
+                            n_extra, int((time_budget - elapsed) / time_per_iter) + 1
+                        )
+                        measure(n_extra)
+                n_timings_done = len(times_ns["cpu"])
+                # Closing may wait for work that is still in flight (e.g. copies
+                # that a pipelined upload has not waited for), which counts
+                # towards the throughput.
                 t0 = time.perf_counter_ns()
-                extra_times = generator.__next__()
-                t1 = time.perf_counter_ns()
-                times_ns["cpu"].append((t1 - t0))
-                if extra_times:
-                    for k, t in extra_times.items():
-                        times_ns[k].append(t)
+                generator.close()
+                close_ns = time.perf_counter_ns() - t0
+            finally:
+                if controlled:
+                    gc.unfreeze()
+                    if gc_was_enabled:
+                        gc.enable()
+                if generator is not None:
+                    generator.close()
+                gc.collect()
+                leaked = release_device(objects_before)
+                if memory is not None and started_tracemalloc:
+                    tracemalloc.stop()
+            startup_ns = _devices["startup_ns"]
+
+            if memory is not None:
+                memory["max_rss"] = get_max_rss()
+                memory["growing"] = find_growing(memory)
 
             # Process results
             stats_str = ""
+            detail_strs = []
+            all_stats = {}
             for k, time_ns in times_ns.items():
-                time_ns = np.array(time_ns)
-                time_ms = time_ns / 1_000_000
-
-                time_mean_ms = np.mean(time_ms)
-                mean_str = f"{time_mean_ms:0.2f}".rjust(6)
-                stats_str += f"  {k.strip()}:{mean_str} ms"
-                # if len(times) == 1:
-                #     stats_str += f" ± {np.std(tt):0.2f}".ljust(6)
-                #     stats_str += str(tt)
+                time_ms = np.array(time_ns) / 1_000_000
+                stats = all_stats[k] = summarize(time_ms)
+
+                if ":" not in k:  # e.g. per-pass gpu times are only in the details
+                    mean_str = f"{stats['mean']:0.2f}".rjust(6)
+                    stats_str += f"  {k.strip()}:{mean_str} ms"
+                    if k == "cpu":
+                        stats_str += f"  first:{first_ns / 1_000_000:6.2f} ms"
+                        if startup_ns:
+                            stats_str += f"  startup:{startup_ns / 1_000_000:6.2f} ms"
+                detail_strs.append(
+                    f"{k.strip()}: median {stats['median']:0.2f}"
+                    + f" [{stats['ci_low']:0.2f}, {stats['ci_high']:0.2f}]"
+                    + f"  p5 {stats['p5']:0.2f}  p95 {stats['p95']:0.2f}"
+                    + f"  p99 {stats['p99']:0.2f}  std {stats['std']:0.2f}"
+                )
             stats_str = stats_str.lstrip(" ")
 
+            # The fraction of the frame time that the GPU is busy. Close to 1
+            # means GPU-bound (e.g. fill rate), close to 0 means CPU-bound
+            # (e.g. Python overhead for submitting the work).
+            gpu_busy = None
+            if "gpu" in all_stats and all_stats["cpu"]["median"] > 0:
+                gpu_busy = all_stats["gpu"]["median"] / all_stats["cpu"]["median"]
+                stats_str += f"  gpu busy: {100 * gpu_busy:0.0f}%"
+
+            # The throughput over all iterations, in bytes per ns, i.e. GB/s
+            gb_per_s = None
+            total_ns = sum(times_ns["cpu"]) + close_ns
+            if nbytes and total_ns > 0:
+                gb_per_s = nbytes * n_timings_done / total_ns
+                stats_str += f"  {gb_per_s:0.2f} GB/s"
+
             # Show results
-            name = func.__name__
-            if name.startswith("benchmark_"):
-                name = name[10:]
             # print([t / 1000_000  for t in times["cpu"]])
-            print(f"{name.rjust(30)} ({n_timings}x) - {stats_str}")
+            counts_str = f"{n_timings_done}x, {n_warmup} warmup"
+            print(f"{case_id.rjust(30)} ({counts_str}) - {stats_str}")
+            for detail_str in detail_strs:
+                print(" " * 34 + detail_str)
+            profile_files = None
+            if profiler is not None:
+                profile_files = profiler.save(config["profile"], case_id)
+                print(" " * 34 + f"profile: {profile_files[0]}")
+            if n_noisy:
+                action = "rejected" if n_rejected else "kept"
+                print(" " * 34 + f"noisy: {n_noisy} iters interrupted ({action})")
+            if leaked and config["device"] != "shared":
+                names = ", ".join(f"{n} {k}" for k, n in sorted(leaked.items()))
+                print(" " * 34 + f"WARNING: wgpu objects left alive: {names}")
+            if memory is not None:
+                print(" " * 34 + format_memory(memory))
+                for key, growth in memory["growing"].items():
+                    if key not in ("buffers", "textures"):
+                        growth = f"{growth / 1024**2:0.1f} MB"
+                    print(" " * 34 + f"WARNING: {key} grows by {growth} over the run")
+
+            # Store results
+            record = create_record(
+                config["run_id"],
+                case_id,
+                module_name,
+                params,
+                {k: [int(t) for t in v] for k, v in times_ns.items()},
+                all_stats,
+                n_timings=n_timings_done,
+                n_warmup=n_warmup,
+                first_ns=first_ns,
+                startup_ns=startup_ns,
+                elapsed=time.perf_counter() - t_begin,
+                gpu_busy=gpu_busy,
+                gb_per_s=gb_per_s,
+                memory=memory,
+                interference=dict(interference, noisy=n_noisy, rejected=n_rejected),
+                leaked=leaked,
+                profile=profile_files,
+                benchmark=name,
+            )
+            if config["stream"]:
+                print(RECORD_PREFIX + json.dumps(record), flush=True)
+            elif config["store"]:
+                append_record(record, config["store"])
+            return record
+
+        name = func.__name__
+        if name.startswith("benchmark_"):
+            name = name[10:]
+        module_name = os.path.splitext(os.path.basename(inspect.getfile(func)))[0]
 
-        inner.__name__ == func.__name__
+        inner.__name__ = func.__name__
+        inner.__wrapped__ = func
         inner.is_benchmark = True
+        inner.benchmark_name = name
+        inner.cases = [(get_case_id(name, case), case) for case in cases]
+        inner.tags = set(tags)
+        if module_name.startswith("bm_"):
+            inner.tags.add(module_name[3:])
+        inner.kind = kind or detect_kind(func)
         return inner
 
     if callable(func):
         return outer(func)
-    elif isinstance(func, int):
+    elif func is None or isinstance(func, int):
         return outer
     else:
         raise TypeError("Unexpected use of @benchmark")
 
 
-def run_all(dict, canvas=None):
-    """To put at the bottom of each benchmark file."""
+class AsyncGeneratorRunner:
+    """Drive an async generator (an ``async def`` benchmark) from sync code.
+
+    Each call to ``__next__()`` runs an event loop until the generator
+    yields, so the harness can time async benchmarks like sync ones. The
+    time includes waiting for awaited work (e.g. ``map_async()``), so the
+    "cpu" time is the wall latency, and "busy" is the CPU time.
+    """
+
+    def __init__(self, agen):
+        self.agen = agen
+        self.loop = asyncio.new_event_loop()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return self.loop.run_until_complete(self.agen.__anext__())
+        except StopAsyncIteration:
+            raise StopIteration from None
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        try:
+            self.loop.run_until_complete(self.agen.aclose())
+        finally:
+            self.loop.close()
+
+
+def warmup(generator):
+    """Run warmup iterations of a benchmark generator.
+
+    Unless a fixed number of iterations is configured, this iterates
+    until the timings in a rolling window no longer trend up or down,
+    limited by max_warmup and max_warmup_time. Returns the time of the
+    first (cold) iteration in ns, and the number of warmup iterations.
+    """
+    n_fixed = config["warmup"]
+    window = config["warmup_window"]
+    t_end = time.perf_counter() + config["max_warmup_time"]
+    times = []
+    while True:
+        t0 = time.perf_counter_ns()
+        generator.__next__()
+        times.append(time.perf_counter_ns() - t0)
+        n = len(times)
+        if n_fixed is not None:
+            if n >= max(1, n_fixed):
+                break
+        elif n >= config["max_warmup"]:
+            break
+        elif n >= 2 and time.perf_counter() >= t_end:
+            break
+        elif n > window and not has_trend(times[-window:]):
+            break
+    return times[0], len(times)
+
+
+def format_memory(memory):
+    """Get a one-line summary of the memory measurements."""
+    mb = 1024**2
+    parts = [f"traced peak {max(memory['traced_peak'], default=0) / mb:0.1f} MB"]
+    if memory["rss"] and memory["rss"][-1] is not None:
+        parts.append(f"rss {memory['rss'][-1] / mb:0.1f} MB")
+    if memory["max_rss"] is not None:
+        parts.append(f"max rss {memory['max_rss'] / mb:0.1f} MB")
+    if memory.get("buffers") and memory["buffers"][-1]:
+        nbytes = memory["buffer_bytes"][-1] / mb
+        parts.append(f"{memory['buffers'][-1]} buffers {nbytes:0.1f} MB")
+    if memory.get("textures") and memory["textures"][-1]:
+        nbytes = memory["texture_bytes"][-1] / mb
+        parts.append(f"{memory['textures'][-1]} textures {nbytes:0.1f} MB")
+    return "memory: " + ", ".join(parts)
+
+
+_gpu_timed_renderers = []
+
+
+def enable_gpu_times(renderer):
+    """Let the harness collect GPU times from the given renderer.
+
+    If the adapter supports timestamp queries, the renderer is set to
+    measure GPU times, and after each iteration the per-pass GPU durations
+    are added to the results as "gpu:<pass>" keys, with the total as "gpu".
+    Otherwise this does nothing, and only CPU times are reported.
+    Returns whether GPU times are measured.
+    """
+    if not HAS_TIMESTAMP_QUERY or not hasattr(renderer, "measure_gpu_times"):
+        return False
+    renderer.measure_gpu_times = True
+    _gpu_timed_renderers.append(renderer)
+    return True
+
+
+def get_gpu_times(renderer):
+    """Get a dict with the GPU times (in ns) of the last frame of a renderer."""
+    stats = getattr(renderer, "stats", None) or {}
+    pass_times = stats.get("gpu_times") or {}
+    times = {f"gpu:{name}": t for name, t in pass_times.items()}
+    if times:
+        times["gpu"] = sum(pass_times.values())
+    return times
+
+
+_submit_ns = [0]
+
+
+def _time_submits(queue):
+    """Let a queue add the time spent in submit() to _submit_ns."""
+    if getattr(queue, "_benchmark_timed", False):
+        return
+    submit = queue.submit
+
+    def timed_submit(command_buffers):
+        t0 = time.perf_counter_ns()
+        submit(command_buffers)
+        _submit_ns[0] += time.perf_counter_ns() - t0
+
+    queue.submit = timed_submit
+    queue._benchmark_timed = True
+
+
+def draw_frame_phases(canvas):
+    """Draw a frame on an offscreen canvas, like ``_draw_frame_and_present()``,
+    and get a dict with the time (in ns) of each phase of the frame:
+
+    * "render": the draw function without the submits, i.e. traversing the
+      scene, updating resources, and encoding commands.
+    * "submit": the calls to ``queue.submit()`` in the draw function.
+    * "wait": waiting for the GPU to finish the submitted work.
+    * "readback": copying the frame from the GPU into a numpy array, and
+      passing it to the canvas' ``present_image()``.
+
+    The result can be yielded by a benchmark.
+    """
+    device = gfx.renderers.wgpu.get_shared().device
+    _time_submits(device.queue)
+    _submit_ns[0] = 0
+    t0 = time.perf_counter_ns()
+    canvas.draw_frame()
+    t1 = time.perf_counter_ns()
+    submit_ns = _submit_ns[0]
+    device.queue.on_submitted_work_done_sync()
+    t2 = time.perf_counter_ns()
+    result = canvas._canvas_context.present()
+    if result.pop("method") == "bitmap":
+        canvas.present_image(result.pop("data"), **result)
+    t3 = time.perf_counter_ns()
+    return {
+        "render": t1 - t0 - submit_ns,
+        "submit": submit_ns,
+        "wait": t2 - t1,
+        "readback": t3 - t2,
+    }
+
+
+# The devices of get_device(): the shared device, the pool of clean
+# devices, and the device of the running benchmark.
+_devices = {
+    "shared": None,
+    "pool": [],
+    "current": None,
+    "active": False,
+    "startup_ns": 0,
+}
+
+# Object types that belong to a device rather than to what a benchmark created
+DEVICE_OBJECT_NAMES = {"Adapter", "Device", "Queue"}
+
+
+def _create_device():
+    adapter = wgpu.gpu.request_adapter(power_preference="high-performance")
+    return adapter.request_device()
+
+
+def _get_shared_device():
+    if _devices["shared"] is None:
+        _devices["shared"] = _create_device()
+    return _devices["shared"]
+
+
+def get_device():
+    """Get the wgpu device to use in a benchmark.
+
+    Depending on ``config["device"]``, this is the same device for all
+    benchmarks ("shared"), a new device for each benchmark ("fresh"), or a
+    device that an earlier benchmark left without live objects ("pooled").
+    The time to create a device is reported as "startup". Outside of a
+    benchmark, the shared device is returned.
+
+    Note that pygfx renderers always use the pygfx shared device.
+    """
+    if not _devices["active"]:
+        return _get_shared_device()
+    if _devices["current"] is None:
+        mode = config["device"]
+        if mode == "shared" and _devices["shared"] is not None:
+            device = _devices["shared"]
+        elif mode == "pooled" and _devices["pool"]:
+            device = _devices["pool"].pop()
+        else:
+            # Only count startup when a device is actually created
+            t0 = time.perf_counter_ns()
+            device = _get_shared_device() if mode == "shared" else _create_device()
+            _devices["startup_ns"] += time.perf_counter_ns() - t0
+        _devices["current"] = device
+    return _devices["current"]
+
+
+def release_device(objects_before):
+    """Release the device of the benchmark that just finished.
+
+    Returns a dict with the number of wgpu objects (per type) that are
+    still alive compared to objects_before. In "pooled" mode, the device
+    is put back in the pool if the benchmark left no objects alive.
+    """
+    leaked = {}
+    for name, count in get_object_counts().items():
+        n = count - objects_before.get(name, 0)
+        if n > 0 and name not in DEVICE_OBJECT_NAMES:
+            leaked[name] = n
+    device = _devices["current"]
+    if config["device"] == "pooled" and device is not None and not leaked:
+        _devices["pool"].append(device)
+    _devices.update(active=False, current=None)
+    return leaked
+
+
+# Names that indicate that code uses the GPU
+GPU_NAMES = {
+    "wgpu",
+    "device",
+    "get_device",
+    "get_shared",
+    "update_resource",
+    "ensure_wgpu_object",
+    "WgpuRenderer",
+    "renderer",
+    "request_draw",
+    "_draw_frame_and_present",
+    "draw_frame_phases",
+}
+
+_module_asts = {}
+
+
+def detect_kind(func):
+    """Detect whether a benchmark function uses the GPU, by inspecting
+    the names used in its source, and in the module-level functions that
+    it calls. Returns "gpu" when in doubt.
+    """
+    nodes = _get_function_nodes(func)
+    if nodes is None:
+        return "gpu"
+    for node in nodes:
+        if isinstance(node, ast.Name):
+            used_name = node.id
+        elif isinstance(node, ast.Attribute):
+            used_name = node.attr
+        else:
+            continue
+        if used_name in GPU_NAMES:
+            return "gpu"
+    return "cpu"
+
+
+def get_pygfx_files(func):
+    """Get the pygfx source files (relative to the pygfx repo) of the pygfx
+    objects that a benchmark function uses, like detect_kind() does.
+    """
+    nodes = _get_function_nodes(func)
+    if nodes is None:
+        return []
+    root = os.path.dirname(os.path.dirname(os.path.abspath(gfx.__file__)))
+
+    def resolve(node):
+        if isinstance(node, ast.Name):
+            return func.__globals__.get(node.id)
+        elif isinstance(node, ast.Attribute):
+            return getattr(resolve(node.value), node.attr, None)
+
+    files = set()
+    for node in nodes:
+        if not isinstance(node, (ast.Name, ast.Attribute)):
+            continue
+        obj = resolve(node)
+        if obj is None or inspect.ismodule(obj):
+            continue
+        module = inspect.getmodule(obj)
+        if module is None or not module.__name__.startswith("pygfx"):
+            continue
+        filename = getattr(module, "__file__", None)
+        if filename:
+            files.add(os.path.relpath(filename, root).replace("\\", "/"))
+    return sorted(files)
+
+
+def _get_function_nodes(func):
+    """Get the AST nodes of a function, and of the module-level functions
+    that it calls. Returns None if the source cannot be followed.
+    """
+    # Closures and local functions cannot be followed reliably
+    if func.__code__.co_freevars or "<locals>" in func.__qualname__:
+        return None
+    try:
+        filename = inspect.getsourcefile(func)
+        if filename not in _module_asts:
+            with open(filename, encoding="utf-8") as f:
+                _module_asts[filename] = ast.parse(f.read())
+    except (OSError, TypeError, SyntaxError):
+        return None
+
+    module_ast = _module_asts[filename]
+    functions = {
+        node.name: node
+        for node in module_ast.body
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+    }
+
+    # Walk the function and the functions that it calls
+    nodes = []
+    todo = [func.__name__]
+    seen = set()
+    while todo:
+        name = todo.pop()
+        if name in seen or name not in functions:
+            continue
+        seen.add(name)
+        for node in ast.walk(functions[name]):
+            nodes.append(node)
+            if isinstance(node, ast.Name):
+                todo.append(node.id)
+    return nodes
+
+
+def expand_params(params, mode="product"):
+    """Expand a dict of parameters into a list of cases.
+
+    Returns (cases, label_maps), where each case is a dict that maps
+    argument names to labels, and label_maps maps argument names to
+    dicts that map labels to values (for params given as a dict).
+    """
+    if mode not in ("product", "zip"):
+        raise ValueError(f"Invalid params_mode: {mode!r}")
+
+    label_maps = {}
+    axes = []  # per key: a list of dicts that each map names to labels
+    for key, options in params.items():
+        names = key if isinstance(key, tuple) else (key,)
+        if isinstance(options, dict):
+            if len(names) > 1:
+                raise ValueError("Labeled params cannot be used with a tuple key.")
+            label_maps[key] = {str(label): val for label, val in options.items()}
+            options = list(label_maps[key])
+        axis = []
+        for option in options:
+            option = option if isinstance(key, tuple) else (option,)
+            if len(option) != len(names):
+                raise ValueError(f"Expected {len(names)} values for {key}.")
+            axis.append(dict(zip(names, option)))
+        axes.append(axis)
+
+    if not axes:
+        return [{}], label_maps
+    elif mode == "zip":
+        if len(set(len(axis) for axis in axes)) > 1:
+            raise ValueError("Zipped params must have the same number of values.")
+        combinations = zip(*axes)
+    else:
+        combinations = itertools.product(*axes)
+
+    cases = []
+    for combination in combinations:
+        case = {}
+        for part in combination:
+            case.update(part)
+        cases.append(case)
+    return cases, label_maps
+
+
+def get_case_id(name, case):
+    """Get the id for a benchmark case, e.g. "points/n_objects=10,n_verts=100"."""
+    if not case:
+        return name
+    return name + "/" + ",".join(f"{k}={v}" for k, v in case.items())
+
+
+def get_generator_params(generator):
+    """Get the arguments of a benchmark generator, and of the generators
+    it delegates to, so they can be stored with the result. Only simple
+    values are included (e.g. not the canvas).
+    """
+    params = {}
+    if isinstance(generator, AsyncGeneratorRunner):
+        generator = generator.agen
+    while inspect.isgenerator(generator) or inspect.isasyncgen(generator):
+        if inspect.isasyncgen(generator):
+            frame = generator.ag_frame
+        else:
+            frame = generator.gi_frame
+        if frame is None:
+            break
+        code = frame.f_code
+        n_args = code.co_argcount + code.co_kwonlyargcount
+        for argname in code.co_varnames[:n_args]:
+            val = frame.f_locals.get(argname)
+            if _is_simple_value(val):
+                params[argname] = val
+        generator = getattr(generator, "gi_yieldfrom", None)
+    return params
+
+
+def _is_simple_value(val):
+    if isinstance(val, (bool, int, float, str)):
+        return True
+    elif isinstance(val, (list, tuple)):
+        return all(_is_simple_value(v) for v in val)
+    return False
+
+
+def collect_benchmarks(dict):
+    """Get the benchmark functions in the given namespace."""
     benchmark_funcs = []
     for ob in dict.values():
         if callable(ob) and getattr(ob, "is_benchmark", False):
             benchmark_funcs.append(ob)
+    return benchmark_funcs
+
+
+def run_all(dict, canvas=None):
+    """To put at the bottom of each benchmark file."""
+    benchmark_funcs = collect_benchmarks(dict)
 
     if canvas is None:
         canvas = OffscreenWgpuCanvas()
 
     for func in benchmark_funcs:
-        func(canvas)
+        for case_id, case in func.cases:
+            func(canvas, **case)
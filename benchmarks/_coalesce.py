@@ -0,0 +1,113 @@
+"""
+Coalescing of dirty ranges into copies, based on a cost model.
+
+pygfx marks the chunks of a buffer that contain changed items, and
+uploads each run of dirty chunks with one copy. The chunk size is a fixed
+trade-off between the per-copy overhead and uploading clean bytes.
+
+Here, the dirty items are turned into byte ranges directly, and the gap
+between two ranges is uploaded along (merging the ranges) only if that is
+predicted to be cheaper than an extra copy. With a cost model of a fixed
+cost per copy plus a cost per byte, this is the case when the gap is
+smaller than fixed_ns / ns_per_byte bytes. Since each gap affects the
+predicted time independently, deciding per gap minimizes the total.
+
+The cost model is fitted from the results of bm_wgpu_buffer_chunksize.py,
+which upload the same buffer with different numbers of chunks.
+"""
+
+import numpy as np
+
+from _store import load_records, get_metadata
+
+# Used when there are no chunksize results for the adapter: 10 µs per copy,
+# and 10 GB/s.
+DEFAULT_COST_MODEL = {"fixed_ns": 10_000.0, "ns_per_byte": 0.1}
+
+
+def fit_cost_model(points):
+    """Fit a cost model from a list of (nbytes, n_copies, time_ns) tuples.
+
+    For each buffer size, the time is fitted as a line over the number of
+    copies: the slope is the cost per copy, and the intercept (the time for
+    zero copies) is the cost of moving the bytes. Returns None if there are
+    not enough points.
+    """
+    groups = {}
+    for nbytes, n_copies, time_ns in points:
+        groups.setdefault(nbytes, []).append((n_copies, time_ns))
+    fixed, per_byte = [], []
+    for nbytes, group in groups.items():
+        n_copies, times = np.array(group, np.float64).T
+        if len(set(n_copies)) < 2:
+            continue
+        slope, intercept = np.polyfit(n_copies, times, 1)
+        fixed.append(slope)
+        per_byte.append(max(intercept, 0.0) / nbytes)
+    if not fixed:
+        return None
+    return {
+        "fixed_ns": max(float(np.median(fixed)), 0.0),
+        "ns_per_byte": float(np.median(per_byte)),
+    }
+
+
+def get_cost_model(path=None, adapter=None):
+    """Get the cost model for an adapter (default the current one) from the
+    up_wbuf_queue_write results of bm_wgpu_buffer_chunksize.py in the store.
+    Falls back to DEFAULT_COST_MODEL.
+    """
+    adapter = adapter or get_metadata()["adapter"]
+    records = load_records(
+        path,
+        module="bm_wgpu_buffer_chunksize",
+        benchmark="up_wbuf_queue_write",
+        adapter=adapter,
+    )
+    points = []
+    for record in records:
+        buffer_size = 2 ** record["params"]["buffer_size2"]
+        chunk_size = 2 ** record["params"]["chunk_size2"]
+        n_copies = max(1, buffer_size // chunk_size)
+        median_ns = 1e6 * record["stats_ms"]["cpu"]["median"]
+        points.append((buffer_size, n_copies, median_ns))
+    return fit_cost_model(points) or dict(DEFAULT_COST_MODEL)
+
+
+def get_max_gap(model):
+    """Get the largest gap (in bytes) that is cheaper to upload than to skip."""
+    if model["ns_per_byte"] <= 0:
+        return np.inf
+    return model["fixed_ns"] / model["ns_per_byte"]
+
+
+def coalesce_indices(indices, itemsize, nbytes, model, align=4):
+    """Get the byte ranges to upload for the given dirty item indices, of a
+    buffer of nbytes bytes.
+
+    Returns (offsets, sizes), two arrays of bytes, aligned to align bytes
+    (copies in wgpu must be aligned to 4 bytes), except that the last range
+    ends at nbytes at most. For a buffer with an unaligned size, that range
+    cannot be copied, like with pygfx' own uploads. Ranges that overlap or touch are always merged,
+    and ranges with a gap are merged if that is predicted to be faster
+    according to the model. The ranges include the bytes around the items
+    that are needed for the alignment, so the data to upload must be taken
+    from the buffer's data (not from the items alone).
+    """
+    indices = np.unique(np.asarray(indices, np.int64))
+    if not len(indices):
+        empty = np.zeros((0,), np.int64)
+        return empty, empty
+    starts = (indices * itemsize) // align * align
+    ends = -((-(indices + 1) * itemsize) // align) * align  # ceil
+    ends = np.minimum(ends, nbytes)
+    gaps = starts[1:] - ends[:-1]
+    split = gaps > get_max_gap(model)
+    offsets = starts[np.concatenate([[True], split])]
+    sizes = ends[np.concatenate([split, [True]])] - offsets
+    return offsets, sizes
+
+
+def predict_time(sizes, model):
+    """Predict the time (in ns) to upload ranges with the given sizes."""
+    return len(sizes) * model["fixed_ns"] + float(np.sum(sizes)) * model["ns_per_byte"]
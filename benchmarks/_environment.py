@@ -0,0 +1,105 @@
+"""
+Control and checks of the environment that benchmarks run in.
+
+Other processes, frequency scaling, and the garbage collector add noise
+to timings. This module helps reduce that noise (CPU pinning), check for
+it before starting (CPU governor, load average), and detect it per
+iteration (context switches and page faults).
+"""
+
+import os
+import glob
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def parse_cpu_list(text):
+    """Parse a Linux CPU list like "2-3,6" into a list of ints."""
+    cpus = []
+    for part in text.strip().split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.extend(range(int(first), int(last) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
+
+
+def get_isolated_cpus():
+    """Get the ids of the CPU cores that are isolated from the scheduler
+    (e.g. with the isolcpus kernel parameter). Returns [] if there are none.
+    """
+    try:
+        with open("/sys/devices/system/cpu/isolated") as f:
+            return parse_cpu_list(f.read())
+    except (OSError, ValueError):
+        return []
+
+
+def get_governors():
+    """Get the set of CPU frequency governors in use (Linux only)."""
+    governors = set()
+    for filename in glob.glob("/sys/devices/system/cpu/cpu*/cpufreq/scaling_governor"):
+        try:
+            with open(filename) as f:
+                governors.add(f.read().strip())
+        except OSError:
+            pass
+    return governors
+
+
+def check_environment(cpus=None, max_load=0.1):
+    """Check whether the machine is quiet enough for benchmarking.
+
+    Returns a list of warnings (strings), empty if all is well. The load
+    average is checked relative to the number of cores.
+    """
+    warnings = []
+    governors = get_governors()
+    if governors and governors != {"performance"}:
+        names = ", ".join(sorted(governors))
+        warnings.append(f"CPU governor is {names}, not performance")
+    if hasattr(os, "getloadavg"):
+        load = os.getloadavg()[0]
+        n_cpus = os.cpu_count() or 1
+        if load / n_cpus > max_load:
+            warnings.append(f"load average is {load:0.2f} on {n_cpus} cores")
+    if cpus is not None and not set(cpus).issubset(get_isolated_cpus()):
+        warnings.append("not running on isolated cores (see isolcpus)")
+    return warnings
+
+
+def pin_to_cpu(cpu):
+    """Pin this process to the given core. Returns whether that worked."""
+    if not hasattr(os, "sched_setaffinity"):
+        return False
+    try:
+        os.sched_setaffinity(0, {cpu})
+    except OSError:
+        return False
+    return True
+
+
+def get_interference():
+    """Get counters of events that interfere with the current thread:
+    (involuntary context switches, voluntary context switches, page faults,
+    major page faults). Returns None if not available.
+
+    Voluntary context switches happen e.g. when waiting for the GPU, and
+    minor page faults when allocating memory, so these can be part of the
+    work that is benchmarked. Involuntary switches and major page faults
+    are caused by other processes or by swapping.
+    """
+    if resource is None:
+        return None
+    who = getattr(resource, "RUSAGE_THREAD", resource.RUSAGE_SELF)
+    usage = resource.getrusage(who)
+    return (
+        usage.ru_nivcsw,
+        usage.ru_nvcsw,
+        usage.ru_minflt + usage.ru_majflt,
+        usage.ru_majflt,
+    )
@@ -0,0 +1,185 @@
+"""
+Cached input arrays for benchmarks.
+
+Many benchmarks need large arrays (e.g. 100 MB) to upload, and creating
+these in the setup of each benchmark takes a lot of time and memory. With
+``get_array()`` such arrays are created once per process, and the
+benchmarks get read-only views of them. Benchmarks that write to an array
+(e.g. because it is the data of a buffer that is updated in place) ask
+for a writeable array, and get their own copy.
+
+The cache is limited to ``config["fixture_budget"]`` bytes; the least
+recently used arrays are dropped when it is full. If
+``config["fixture_dir"]`` is set, large arrays are saved as .npy files in
+that directory and memory-mapped, so that other processes (e.g. when each
+benchmark runs in a subprocess) share them via the OS page cache.
+"""
+
+import os
+import hashlib
+import collections
+
+import numpy as np
+
+from _benchmark import config
+
+# Arrays at least this large (in bytes) are memory-mapped if fixture_dir is set
+MEMMAP_THRESHOLD = 64 * 2**20
+
+_cache = collections.OrderedDict()
+stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def empty_aligned(shape, dtype=np.float64, align=4096):
+    """Get an array with desired memory alignment.
+
+    Parameters
+    ==========
+    shape: tuple of ints
+        The desired final shape of the array
+
+    dtype:
+        The desired dtype of the array
+
+    align:
+        The byte alignment of the array
+
+    Returns
+    =======
+    aligned_array:
+        Aligned array of desired shape.
+
+    """
+
+    if not isinstance(shape, tuple):
+        shape = (shape,)
+
+    dtype = np.dtype(dtype)
+    size = dtype.itemsize
+    # Compute the final size of the array
+    for s in shape:
+        size *= s
+
+    a = np.empty(size + (align - 1), dtype=np.uint8)
+    data_align = a.ctypes.data % align
+    offset = 0 if data_align == 0 else (align - data_align)
+    arr = a[offset : offset + size].view(dtype)
+    # Don't use reshape since reshape might copy the data.
+    # This is the suggested way to assign a new shape with guarantee
+    # That the data won't be copied.
+    arr.shape = shape
+    return arr
+
+
+def _normalize_step(step, ndim):
+    if isinstance(step, int):
+        step = (step,)
+    step = tuple(step) + (1,) * (ndim - len(step))
+    if len(step) != ndim or min(step) < 1:
+        raise ValueError(f"Invalid step {step} for an array with {ndim} dims")
+    return step
+
+
+def _allocate(shape, dtype, align):
+    if align:
+        return empty_aligned(shape, dtype, align)
+    return np.empty(shape, dtype)
+
+
+def _fill(a, fill):
+    if fill == "random":
+        rng = np.random.default_rng(0)  # deterministic
+        if a.dtype.kind in "iu":
+            info = np.iinfo(a.dtype)
+            a[...] = rng.integers(info.min, info.max, a.shape, a.dtype, True)
+        else:
+            a[...] = rng.random(a.shape)
+    else:
+        a.fill(fill)
+
+
+def _memmap_filename(key):
+    text = repr(key).encode()
+    return os.path.join(config["fixture_dir"], hashlib.sha1(text).hexdigest() + ".npy")
+
+
+def _create(key):
+    base_shape, dtype, fill, align = key
+    nbytes = int(np.prod(base_shape)) * dtype.itemsize
+    # Files are only mapped at an alignment of 64 bytes (the .npy header size)
+    if config["fixture_dir"] and nbytes >= MEMMAP_THRESHOLD and (align or 0) <= 64:
+        filename = _memmap_filename(key)
+        if not os.path.isfile(filename):
+            # Other processes may create the same file at the same time, so
+            # each writes its own temporary file, and the first one wins.
+            os.makedirs(config["fixture_dir"], exist_ok=True)
+            tmp_filename = f"{filename}.{os.getpid()}.tmp"
+            a = np.lib.format.open_memmap(tmp_filename, "w+", dtype, base_shape)
+            _fill(a, fill)
+            a.flush()
+            del a
+            try:
+                os.replace(tmp_filename, filename)
+            except OSError:
+                # E.g. on Windows, if another process has it mapped already
+                os.remove(tmp_filename)
+                if not os.path.isfile(filename):
+                    raise
+        return np.load(filename, mmap_mode="r")
+    a = _allocate(base_shape, dtype, align)
+    _fill(a, fill)
+    a.flags.writeable = False
+    return a
+
+
+def _evict(budget, keep):
+    total = sum(a.nbytes for a in _cache.values())
+    for key in list(_cache):
+        if total <= budget:
+            break
+        if key != keep:
+            total -= _cache.pop(key).nbytes
+            stats["evictions"] += 1
+
+
+def get_array(shape, dtype=np.uint8, fill=0, *, align=None, step=1, writeable=False):
+    """Get an array with the given shape and dtype, filled with a value
+    (or "random" for deterministic random values).
+
+    The array is a view with the given step along each dimension (an int
+    for the first dimension, or a tuple), to get non-contiguous data. With
+    align, the start of the data is aligned to this many bytes.
+
+    The array is read-only, and shared with other callers, unless writeable
+    is True, in which case a new array with the same layout is returned.
+    """
+    shape = (shape,) if isinstance(shape, int) else tuple(shape)
+    dtype = np.dtype(dtype)
+    step = _normalize_step(step, len(shape))
+    base_shape = tuple(n * s for n, s in zip(shape, step))
+    key = (base_shape, dtype, fill, align)
+    index = tuple(slice(None, None, s) for s in step)
+
+    if writeable and fill == 0 and not align:
+        # Zeroed lazily by the OS, which is cheaper than copying
+        return np.zeros(base_shape, dtype)[index]
+
+    base = _cache.get(key)
+    if base is None:
+        stats["misses"] += 1
+        base = _cache[key] = _create(key)
+        _evict(config["fixture_budget"], key)
+    else:
+        stats["hits"] += 1
+        _cache.move_to_end(key)
+
+    if writeable:
+        a = _allocate(base_shape, dtype, align)
+        a[...] = base
+        return a[index]
+    return base[index]
+
+
+def clear():
+    """Drop all cached arrays."""
+    _cache.clear()
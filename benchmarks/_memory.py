@@ -0,0 +1,102 @@
+"""
+Memory measurements for benchmarks.
+
+Three kinds of memory are tracked:
+
+* The Python heap (via tracemalloc), i.e. numpy arrays and Python objects.
+* The resident set size (RSS) of the process, which also includes memory
+  allocated by wgpu-native and the driver.
+* The wgpu objects (buffers and textures) that are alive, and their size.
+"""
+
+import os
+import sys
+
+import numpy as np
+import wgpu
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def get_rss():
+    """Get the current resident set size of this process in bytes, or None."""
+    try:
+        with open("/proc/self/statm") as f:
+            n_pages = int(f.read().split()[1])
+        return n_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def get_max_rss():
+    """Get the high-water mark of the resident set size in bytes, or None."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return max_rss  # bytes on MacOS
+    return max_rss * 1024  # KiB on Linux
+
+
+def get_gpu_memory():
+    """Get the number of live wgpu buffers and textures, and their size in bytes."""
+    try:
+        counts = wgpu.diagnostics.object_counts.get_dict()
+    except AttributeError:
+        return {}
+    result = {}
+    for name in ("Buffer", "Texture"):
+        d = counts.get(name, {})
+        key = name.lower() + "s"
+        result[key] = d.get("count", 0)
+        result[key[:-1] + "_bytes"] = d.get("resource_mem", 0)
+    return result
+
+
+def get_object_counts():
+    """Get the number of live wgpu objects per type (e.g. "Buffer"), or {}."""
+    try:
+        counts = wgpu.diagnostics.object_counts.get_dict()
+    except AttributeError:
+        return {}
+    return {name: d.get("count", 0) for name, d in counts.items() if name != "total"}
+
+
+def get_growth(values):
+    """Get by how much a series of values grows over its length, based on
+    a linear fit, so that a single spike does not count as growth.
+    """
+    values = np.asarray([v for v in values if v is not None], np.float64)
+    if len(values) < 3:
+        return 0.0
+    x = np.arange(len(values))
+    slope = np.polyfit(x, values, 1)[0]
+    return float(slope * (len(values) - 1))
+
+
+def find_growing(memory, min_growth=1024**2, min_fraction=0.01):
+    """Get a dict of the memory series that grow across iterations.
+
+    A series is considered growing if the growth is larger than min_growth
+    bytes (or objects, for counts), and larger than min_fraction of the
+    initial value.
+    """
+    growing = {}
+    for key, values in memory.items():
+        if key == "traced_peak":
+            continue  # a per-iteration peak, not a cumulative amount
+        if not isinstance(values, list) or not values or values[0] is None:
+            continue
+        growth = get_growth(values)
+        threshold = 1 if key in ("buffers", "textures") else min_growth
+        if growth >= threshold and growth >= min_fraction * values[0]:
+            growing[key] = growth
+    return growing
@@ -0,0 +1,174 @@
+"""
+Profiling of the timed region of benchmarks.
+
+Two profilers run at the same time, and only while the benchmark's
+measurement iterations run (not during setup):
+
+* cProfile, which results in a ``.pstats`` file that can be inspected
+  with e.g. ``python -m pstats`` or snakeviz.
+* A sampling profiler, which results in a ``.collapsed`` file with
+  one line per unique stack, in the format used by flamegraph.pl
+  and speedscope.
+
+The number of profiled iterations is written to a ``.json`` file, so that
+profiles of runs with a different number of iterations can be compared.
+"""
+
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+from collections import Counter
+
+
+class SamplingProfiler:
+    """Samples the stack of a thread at a regular interval, while enabled."""
+
+    def __init__(self, interval=0.001, thread_id=None):
+        self._interval = interval
+        self._thread_id = thread_id or threading.get_ident()
+        self._enabled = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self.stacks = Counter()
+
+    def enable(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._enabled.set()
+
+    def disable(self):
+        self._enabled.clear()
+
+    def stop(self):
+        self._stopped = True
+        self._enabled.set()  # wake up the thread so it can exit
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            self._enabled.wait()
+            if self._stopped:
+                break
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self.stacks[get_stack_key(frame)] += 1
+            del frame
+            time.sleep(self._interval)
+
+    def get_collapsed(self):
+        """Get the samples as text in the collapsed-stack format."""
+        lines = [f"{stack} {count}" for stack, count in sorted(self.stacks.items())]
+        return "\n".join(lines) + "\n"
+
+
+def get_stack_key(frame):
+    """Get a string representing the stack, root first, separated by semicolons."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        filename = shorten_filename(code.co_filename)
+        names.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def shorten_filename(filename):
+    """Make a filename shorter, but still unique, e.g. pygfx/resources/_buffer.py."""
+    filename = filename.replace("\\", "/")
+    if "site-packages/" in filename:
+        return filename.split("site-packages/")[-1]
+    return "/".join(filename.split("/")[-2:])
+
+
+class Profiler:
+    """Combines cProfile and a sampling profiler."""
+
+    def __init__(self, interval=0.001):
+        self._cprofile = cProfile.Profile()
+        self._sampler = SamplingProfiler(interval)
+        self.n_iterations = 0
+
+    def enable(self):
+        self.n_iterations += 1
+        self._sampler.enable()
+        self._cprofile.enable()
+
+    def disable(self):
+        self._cprofile.disable()
+        self._sampler.disable()
+
+    def save(self, directory, name):
+        """Stop profiling and write the .pstats, .collapsed and .json files.
+        Returns the filenames of the first two.
+        """
+        self._sampler.stop()
+        os.makedirs(directory, exist_ok=True)
+        basename = os.path.join(directory, safe_filename(name))
+        self._cprofile.dump_stats(basename + ".pstats")
+        with open(basename + ".collapsed", "w", encoding="utf-8") as f:
+            f.write(self._sampler.get_collapsed())
+        with open(basename + ".json", "w", encoding="utf-8") as f:
+            json.dump({"n_iterations": self.n_iterations}, f)
+        return basename + ".pstats", basename + ".collapsed"
+
+
+def safe_filename(name):
+    """Turn a benchmark name into something that can be used as a filename."""
+    return "".join(c if c.isalnum() or c in "-_.=," else "_" for c in name)
+
+
+def compare_profiles(filename1, filename2, n=30):
+    """Get a text table of the functions whose own time (tottime) per
+    iteration changed the most between two .pstats files.
+
+    Functions are matched by filename and name, so that a function that
+    moved to another line (e.g. in a new pygfx version) is still matched.
+    For profiles without a .json file with the number of iterations, the
+    total times are compared.
+    """
+    tottimes1 = _get_tottimes(filename1)
+    tottimes2 = _get_tottimes(filename2)
+    n_iterations1 = _get_n_iterations(filename1)
+    n_iterations2 = _get_n_iterations(filename2)
+    if n_iterations1 and n_iterations2:
+        unit = "ms/iter"
+    else:
+        unit, n_iterations1, n_iterations2 = "ms", 1, 1
+    deltas = []
+    for func in set(tottimes1) | set(tottimes2):
+        t1 = tottimes1.get(func, 0.0) / n_iterations1
+        t2 = tottimes2.get(func, 0.0) / n_iterations2
+        deltas.append((t2 - t1, t1, t2, func))
+    deltas.sort(key=lambda d: -abs(d[0]))
+
+    headers = [f"delta {unit}", f"before {unit}", f"after {unit}"]
+    lines = [" ".join(h.rjust(14) for h in headers) + "  function"]
+    for delta, t1, t2, func in deltas[:n]:
+        filename, funcname = func
+        lines.append(
+            f"{1000 * delta:+14.3f} {1000 * t1:14.3f} {1000 * t2:14.3f}  {funcname} ({filename})"
+        )
+    return "\n".join(lines)
+
+
+def _get_tottimes(filename):
+    stats = pstats.Stats(filename)
+    # stats.stats maps (filename, lineno, funcname) -> (cc, nc, tt, ct, callers)
+    tottimes = Counter()
+    for (path, lineno, funcname), value in stats.stats.items():
+        tottimes[(shorten_filename(path), funcname)] += value[2]
+    return tottimes
+
+
+def _get_n_iterations(filename):
+    filename = os.path.splitext(filename)[0] + ".json"
+    if not os.path.isfile(filename):
+        return None
+    with open(filename, "r", encoding="utf-8") as f:
+        return json.load(f)["n_iterations"]
@@ -0,0 +1,143 @@
+"""
+Scheduling of benchmarks within a wall-clock budget.
+
+Based on the results in the store, the benchmarks are prioritized:
+
+* Benchmarks without results on this machine come first.
+* Then the benchmarks that use pygfx files that changed since the pygfx
+  commit of the last run (detected from the pygfx names that the
+  benchmark uses, so this is a heuristic).
+* Then the benchmarks with the widest confidence interval in their last
+  run, or the largest variation of the median over recent runs.
+
+Benchmarks are selected in order of priority for as long as their expected
+duration (based on the previous run) fits in the budget. The time that is
+left is divided over the selected benchmarks, in proportion to their
+uncertainty, as the time budget for extra iterations.
+"""
+
+import os
+import socket
+import subprocess
+
+import numpy as np
+
+from _store import load_records, _git_sha
+
+# The time it takes to start a subprocess and get a device
+SUBPROCESS_OVERHEAD = 3.0
+# The expected duration of a benchmark that has not been run before
+DEFAULT_DURATION = 30.0
+# The number of recent runs to estimate the variation of the median from
+N_RECENT = 10
+
+
+def get_history(path=None, hostname=None):
+    """Get the records of this machine, grouped by (module, name), oldest first."""
+    hostname = hostname or socket.gethostname()
+    history = {}
+    for record in load_records(path, hostname=hostname):
+        history.setdefault((record["module"], record["name"]), []).append(record)
+    return history
+
+
+def get_changed_files(history):
+    """Get the pygfx files that changed since the pygfx commit of the last
+    run, including uncommitted changes. Returns None if this is unknown.
+    """
+    import pygfx as gfx
+
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(gfx.__file__)))
+    if not _git_sha(repo_dir):
+        return None  # not a git checkout, e.g. installed from PyPI
+    records = [r for records in history.values() for r in records]
+    records = [r for r in records if r.get("meta", {}).get("pygfx_sha")]
+    if not records:
+        return None
+    last_sha = max(records, key=lambda r: r["run_id"])["meta"]["pygfx_sha"]
+    try:
+        output = subprocess.check_output(
+            ["git", "diff", "--name-only", last_sha],
+            cwd=repo_dir,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return set(output.split())
+
+
+def get_uncertainty(records):
+    """Get the relative uncertainty of a benchmark's cpu time: the largest
+    of the CI half-width of the last run, and the coefficient of variation
+    of the medians of recent runs.
+    """
+    stats = records[-1]["stats_ms"]["cpu"]
+    uncertainty = 0.0
+    if stats["median"] > 0:
+        uncertainty = 0.5 * (stats["ci_high"] - stats["ci_low"]) / stats["median"]
+    medians = [r["stats_ms"]["cpu"]["median"] for r in records[-N_RECENT:]]
+    if len(medians) >= 3 and np.mean(medians) > 0:
+        uncertainty = max(uncertainty, float(np.std(medians) / np.mean(medians)))
+    return max(uncertainty, 0.001)
+
+
+def get_priority(info, history, changed_files):
+    """Get (priority, uncertainty, reason) for a benchmark. Higher goes first."""
+    records = history.get((info["module"], info["name"]))
+    if not records:
+        return np.inf, 1.0, "no results"
+    uncertainty = get_uncertainty(records)
+    changed = sorted(set(info.get("pygfx_files", ())) & (changed_files or set()))
+    if changed:
+        return 1 + uncertainty, uncertainty, "changed: " + ", ".join(changed)
+    return uncertainty, uncertainty, f"uncertainty {100 * uncertainty:0.1f}%"
+
+
+def get_expected_duration(records):
+    """Get the expected duration of a benchmark and of its measurements,
+    based on its last run.
+    """
+    if not records:
+        return DEFAULT_DURATION, 0.0
+    record = records[-1]
+    measurement = sum(record["samples_ns"]["cpu"]) / 1e9
+    return record.get("elapsed", measurement) + SUBPROCESS_OVERHEAD, measurement
+
+
+def schedule(infos, budget, history, changed_files=None):
+    """Select benchmarks to run within the budget (in seconds).
+
+    Returns (scheduled, time_budgets), where scheduled is a list of
+    (info, reason) in the original order, and time_budgets maps the names
+    of the scheduled benchmarks to the time to spend on measurements.
+    """
+    candidates = []
+    for i, info in enumerate(infos):
+        priority, uncertainty, reason = get_priority(info, history, changed_files)
+        records = history.get((info["module"], info["name"]))
+        duration, measurement = get_expected_duration(records)
+        candidates.append(
+            (priority, i, info, uncertainty, reason, duration, measurement)
+        )
+    candidates.sort(key=lambda c: (-c[0], c[1]))
+
+    # Select by priority, as long as the benchmarks fit
+    selected = []
+    remaining = budget
+    for candidate in candidates:
+        duration = candidate[5]
+        if duration <= remaining:
+            selected.append(candidate)
+            remaining -= duration
+
+    # Divide the remaining time for extra iterations
+    total_uncertainty = sum(c[3] for c in selected)
+    time_budgets = {}
+    for _, _, info, uncertainty, _, _, measurement in selected:
+        extra = remaining * uncertainty / total_uncertainty
+        time_budgets[info["name"]] = measurement + extra
+
+    selected.sort(key=lambda c: c[1])
+    scheduled = [(c[2], c[4]) for c in selected]
+    return scheduled, time_budgets
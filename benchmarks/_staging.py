@@ -0,0 +1,202 @@
+"""
+A pool of staging buffers for uploads via mapped buffers.
+
+Uploading data with ``write_mapped()`` needs a buffer with usage
+MAP_WRITE | COPY_SRC, from which the data is copied into the target buffer
+on the GPU. Creating such a buffer for each upload costs an allocation
+(and for large buffers, zeroing the memory). The pool keeps these buffers
+around instead:
+
+* Buffers are bucketed by size class (powers of two), so that uploads of
+  similar sizes share buffers.
+* A buffer is released after submitting the copy from it, and is mapped
+  again for reuse when it is acquired, by which time the copy is usually
+  done, so that mapping it does not wait.
+* When the total size of the buffers exceeds max_bytes, the least recently
+  used free buffers are destroyed.
+
+The UploadPipeline goes a step further for streaming uploads: it cycles
+through k staging buffers, so that filling the next buffer can overlap
+with the GPU copying from the previous ones.
+
+With ``upload_buffers()``, the dirty chunks of many (small) pygfx buffers
+are uploaded through one staging buffer, with one submit.
+"""
+
+import asyncio
+import collections
+
+import numpy as np
+import wgpu
+
+STAGING_USAGE = wgpu.BufferUsage.MAP_WRITE | wgpu.BufferUsage.COPY_SRC
+
+
+def get_size_class(nbytes, min_size=2**16):
+    """Get the size of the staging buffer for an upload of nbytes."""
+    size = min_size
+    while size < nbytes:
+        size *= 2
+    return size
+
+
+class StagingPool:
+    """A pool of staging buffers for a device.
+
+    Use ``acquire(nbytes)`` to get a mapped buffer of at least nbytes,
+    write to it, unmap it, encode the copy and submit, and then give it
+    back with ``release(buffer)``.
+    """
+
+    def __init__(self, device, max_bytes=512 * 2**20, min_size=2**16):
+        self._device = device
+        self._max_bytes = max_bytes
+        self._min_size = min_size
+        # The mapped buffers that can be used, per size class, least recently
+        # used first, and the buffers that were released but not yet mapped.
+        self._free = collections.OrderedDict()
+        self._released = []
+        self.total_bytes = 0
+        self.stats = {"created": 0, "reused": 0, "destroyed": 0}
+
+    def acquire(self, nbytes):
+        """Get a staging buffer of at least nbytes, mapped for writing."""
+        self._map_released()
+        size = get_size_class(nbytes, self._min_size)
+        for buffer in reversed(self._free):
+            if buffer.size == size:
+                del self._free[buffer]
+                self.stats["reused"] += 1
+                return buffer
+        buffer = self._device.create_buffer(
+            size=size, usage=STAGING_USAGE, mapped_at_creation=True
+        )
+        self.total_bytes += size
+        self.stats["created"] += 1
+        self.trim()
+        return buffer
+
+    def release(self, buffer):
+        """Give back a buffer, after the copy from it has been submitted."""
+        self._released.append(buffer)
+
+    def trim(self, max_bytes=None):
+        """Destroy the least recently used free buffers until the total size
+        is within max_bytes (default the pool's max_bytes).
+        """
+        max_bytes = self._max_bytes if max_bytes is None else max_bytes
+        while self.total_bytes > max_bytes and self._free:
+            buffer, _ = self._free.popitem(last=False)
+            self.total_bytes -= buffer.size
+            self.stats["destroyed"] += 1
+            buffer.destroy()
+
+    def _map_released(self):
+        # Mapping waits until the GPU is done with the buffer
+        for buffer in self._released:
+            buffer.map(wgpu.MapMode.WRITE)
+            self._free[buffer] = None
+        self._released.clear()
+        self.trim()
+
+
+class UploadPipeline:
+    """Upload data through k staging buffers that can be in flight at once.
+
+    Each upload fills the next staging buffer, submits the copy from it,
+    and starts mapping it again asynchronously (in a task on the running
+    event loop). An upload only waits when the staging buffer whose turn
+    it is, is still in use by the GPU, i.e. when all k buffers are busy.
+    Call ``flush()`` to wait for all uploads.
+
+    Note that with wgpu versions where ``map_async()`` blocks, the mapping
+    waits for the GPU when the task runs, so there is little overlap.
+    """
+
+    def __init__(self, device, size, k=2):
+        self._device = device
+        self._buffers = [
+            device.create_buffer(
+                size=size, usage=STAGING_USAGE, mapped_at_creation=True
+            )
+            for _ in range(k)
+        ]
+        self._mapping = [None] * k
+        self._index = 0
+
+    async def upload(self, fill, target, target_offset, size):
+        """Upload size bytes to target at target_offset. The fill function
+        is called with the mapped staging buffer to write the data to it
+        (at offset 0).
+        """
+        i = self._index
+        self._index = (i + 1) % len(self._buffers)
+        buffer = self._buffers[i]
+        if self._mapping[i] is not None:
+            await self._mapping[i]
+            self._mapping[i] = None
+
+        fill(buffer)
+        buffer.unmap()
+        encoder = self._device.create_command_encoder()
+        encoder.copy_buffer_to_buffer(buffer, 0, target, target_offset, size)
+        self._device.queue.submit([encoder.finish()])
+
+        self._mapping[i] = asyncio.ensure_future(buffer.map_async(wgpu.MapMode.WRITE))
+
+    async def flush(self):
+        """Wait until all uploads are done, and the buffers are mapped again."""
+        for i, task in enumerate(self._mapping):
+            if task is not None:
+                await task
+                self._mapping[i] = None
+
+
+def upload_buffers(device, buffers, pool):
+    """Upload the dirty chunks of many pygfx buffers in one go.
+
+    Instead of a ``queue.write_buffer()`` per chunk (as pygfx'
+    ``update_resource()`` does for each buffer), the chunks of all buffers
+    are written straight into one mapped staging buffer from the pool, and
+    copied with one command encoder and a single submit. The buffers must
+    have a wgpu object. Returns the number of bytes that were staged.
+
+    Buffer copies must be 4-byte aligned. The chunks of pygfx buffers are,
+    except the last one of a buffer with an unaligned size (e.g. 3 uint8
+    items). Padding that chunk would overwrite data after it, or write
+    past the end of the buffer, so a ``ValueError`` is raised instead.
+    """
+    copies = []
+    nbytes = 0
+    for buffer in buffers:
+        wgpu_buffer = buffer._wgpu_object
+        for chunk_description in buffer._gfx_get_chunk_descriptions():
+            # Buffers without local data give (offset, size, data)
+            if len(chunk_description) == 3:
+                offset, size, chunk = chunk_description
+            else:
+                offset, size = chunk_description
+                chunk = buffer._gfx_get_chunk_data(offset, size)
+            target_offset = offset * buffer.itemsize
+            if target_offset % 4 or chunk.nbytes % 4:
+                raise ValueError(
+                    f"Cannot copy {chunk.nbytes} bytes at offset {target_offset} "
+                    f"of a buffer of {wgpu_buffer.size} bytes: not 4-byte aligned."
+                )
+            copies.append((chunk, wgpu_buffer, target_offset, nbytes))
+            nbytes += -(-chunk.nbytes // 8) * 8  # mapped ranges are 8-byte aligned
+    if not copies:
+        return 0
+    staging_buffer = pool.acquire(nbytes)
+    for chunk, _, _, staging_offset in copies:
+        chunk_bytes = chunk.reshape(-1).view(np.uint8)
+        staging_buffer.write_mapped(chunk_bytes, staging_offset)
+    staging_buffer.unmap()
+    encoder = device.create_command_encoder()
+    for chunk, target, target_offset, staging_offset in copies:
+        encoder.copy_buffer_to_buffer(
+            staging_buffer, staging_offset, target, target_offset, chunk.nbytes
+        )
+    device.queue.submit([encoder.finish()])
+    pool.release(staging_buffer)
+    return nbytes
@@ -0,0 +1,141 @@
+"""
+Statistics for benchmark timings.
+
+Timings of a benchmark are not normally distributed: they have a hard
+lower bound and a long tail caused by GC pauses, driver hiccups, and
+other processes. We therefore prefer the median and percentiles over
+the mean, and use bootstrapping to estimate confidence intervals
+without assuming a distribution.
+"""
+
+import math
+
+import numpy as np
+
+PERCENTILES = 5, 95, 99
+
+
+def bootstrap_ci(samples, stat=np.median, confidence=0.95, n_resamples=1000, seed=0):
+    """Estimate a confidence interval for a statistic by bootstrapping.
+
+    Returns a tuple (low, high). The resampling is done in batches to
+    keep memory in check when there are many samples.
+    """
+    samples = np.asarray(samples, np.float64)
+    n = len(samples)
+    if n == 0:
+        return np.nan, np.nan
+    elif n == 1:
+        return samples[0], samples[0]
+
+    rng = np.random.default_rng(seed)
+    batch_size = max(1, min(n_resamples, 2_000_000 // n))
+    estimates = []
+    for i in range(0, n_resamples, batch_size):
+        nb = min(batch_size, n_resamples - i)
+        indices = rng.integers(0, n, (nb, n))
+        estimates.append(stat(samples[indices], axis=1))
+    estimates = np.concatenate(estimates)
+
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(estimates, [alpha, 1 - alpha])
+    return float(low), float(high)
+
+
+def summarize(samples, confidence=0.95):
+    """Calculate summary statistics for a list of timings.
+
+    The returned dict has the same unit as the samples.
+    """
+    samples = np.asarray(samples, np.float64)
+    ci_low, ci_high = bootstrap_ci(samples, confidence=confidence)
+    stats = {
+        "n": len(samples),
+        "mean": float(np.mean(samples)),
+        "median": float(np.median(samples)),
+        "std": float(np.std(samples, ddof=1)) if len(samples) > 1 else 0.0,
+        "min": float(np.min(samples)),
+        "max": float(np.max(samples)),
+    }
+    for p in PERCENTILES:
+        stats[f"p{p}"] = float(np.percentile(samples, p))
+    stats["ci_low"] = ci_low
+    stats["ci_high"] = ci_high
+    return stats
+
+
+def relative_ci_width(samples, confidence=0.95):
+    """Get the half-width of the confidence interval of the median,
+    relative to the median. E.g. 0.02 means the median is known within ±2%.
+    """
+    median = np.median(samples)
+    if median <= 0:
+        return 0.0
+    ci_low, ci_high = bootstrap_ci(samples, confidence=confidence, n_resamples=400)
+    return 0.5 * (ci_high - ci_low) / median
+
+
+def _rank_with_ties(values):
+    """Get the ranks (starting at 1) of the values, using the average rank for ties.
+    Also returns the sizes of the groups of tied values.
+    """
+    order = np.argsort(values, kind="mergesort")
+    sorted_values = values[order]
+    # Find the start of each group of equal values
+    is_new = np.concatenate([[True], sorted_values[1:] != sorted_values[:-1]])
+    group_ids = np.cumsum(is_new) - 1
+    group_starts = np.flatnonzero(is_new)
+    group_sizes = np.diff(np.append(group_starts, len(values)))
+    # The average rank of a group is the mean of its first and last rank
+    group_ranks = group_starts + 0.5 * (group_sizes + 1)
+    ranks = np.empty(len(values), np.float64)
+    ranks[order] = group_ranks[group_ids]
+    return ranks, group_sizes
+
+
+def mann_whitney_u(samples1, samples2):
+    """Perform a two-sided Mann-Whitney U test.
+
+    Tests whether the samples come from the same distribution, without
+    assuming a normal distribution. Uses the normal approximation with
+    tie and continuity correction, which is accurate enough for the
+    sample counts we use (~10 or more per group).
+
+    Returns (u, p), where u is the U statistic of samples1.
+    """
+    samples1 = np.asarray(samples1, np.float64)
+    samples2 = np.asarray(samples2, np.float64)
+    n1, n2 = len(samples1), len(samples2)
+    if n1 == 0 or n2 == 0:
+        return np.nan, 1.0
+
+    ranks, tie_sizes = _rank_with_ties(np.concatenate([samples1, samples2]))
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2
+
+    n = n1 + n2
+    mu = n1 * n2 / 2
+    tie_term = (tie_sizes**3 - tie_sizes).sum() / (n * (n - 1))
+    sigma = np.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term))
+    if sigma == 0:
+        return float(u), 1.0
+    z = (abs(u - mu) - 0.5) / sigma
+    p = math.erfc(max(z, 0) / math.sqrt(2))
+    return float(u), min(p, 1.0)
+
+
+def has_trend(samples, threshold=0.05):
+    """Get whether a series of timings still trends up or down.
+
+    Compares the median of the first and second half of the samples, which
+    is robust to single outliers. Returns True if these differ by more than
+    threshold, relative to the overall median.
+    """
+    samples = np.asarray(samples, np.float64)
+    if len(samples) < 4:
+        return True
+    median = np.median(samples)
+    if median <= 0:
+        return False
+    half = len(samples) // 2
+    delta = np.median(samples[-half:]) - np.median(samples[:half])
+    return abs(delta) / median > threshold
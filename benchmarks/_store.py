@@ -0,0 +1,213 @@
+"""
+Storage of benchmark results.
+
+Each benchmark that is run produces one record, which is appended as a
+line of JSON to the store (a JSON Lines file). Records contain the raw
+samples, summary statistics, the benchmark parameters, and metadata
+about the machine and software. Each record is self-contained, so the
+store can be concatenated, filtered, and copied between machines with
+standard tools.
+"""
+
+import os
+import json
+import uuid
+import time
+import socket
+import platform
+import subprocess
+import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_STORE = os.path.join(REPO_DIR, ".results", "results.jsonl")
+
+
+def new_run_id():
+    """Create a new id for a run. Sorts in chronological order."""
+    return time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+
+
+def _git_sha(path):
+    """Get the git commit of the repo at the given path, or None if
+    the path is not the root of a git repo (e.g. a site-packages dir).
+    """
+    try:
+        toplevel, sha = subprocess.check_output(
+            ["git", "rev-parse", "--show-toplevel", "HEAD"],
+            cwd=path,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).split()
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+    if os.path.realpath(toplevel) != os.path.realpath(path):
+        return None
+    return sha
+
+
+def _cpu_model():
+    system = platform.system()
+    if system == "Linux":
+        try:
+            with open("/proc/cpuinfo") as f:
+                for line in f:
+                    if line.startswith("model name"):
+                        return line.split(":", 1)[1].strip()
+        except OSError:
+            pass
+    elif system == "Darwin":
+        try:
+            return subprocess.check_output(
+                ["sysctl", "-n", "machdep.cpu.brand_string"], text=True
+            ).strip()
+        except (OSError, subprocess.CalledProcessError):
+            pass
+    return platform.processor() or None
+
+
+_metadata = None
+
+
+def get_metadata():
+    """Get metadata about the machine and software. The result is cached."""
+    global _metadata
+    if _metadata is not None:
+        return _metadata
+
+    import numpy as np
+    import wgpu
+    import pygfx as gfx
+    from pygfx.renderers.wgpu import get_shared
+
+    try:
+        adapter_summary = get_shared().device.adapter.summary
+    except Exception as err:
+        adapter_summary = f"unavailable ({err})"
+
+    _metadata = {
+        "hostname": socket.gethostname(),
+        "platform": platform.platform(),
+        "cpu": _cpu_model(),
+        "cpu_count": os.cpu_count(),
+        "adapter": adapter_summary,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "wgpu": wgpu.__version__,
+        "pygfx": gfx.__version__,
+        "pygfx_sha": _git_sha(os.path.dirname(os.path.dirname(gfx.__file__))),
+        "benchmarks_sha": _git_sha(REPO_DIR),
+    }
+    return _metadata
+
+
+def create_record(run_id, name, module, params, samples_ns, stats, **extra):
+    """Create a record for a benchmark result."""
+    record = {
+        "run_id": run_id,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "name": name,
+        "module": module,
+        "params": params,
+        "samples_ns": samples_ns,
+        "stats_ms": stats,
+    }
+    record.update(extra)
+    record["meta"] = get_metadata()
+    return record
+
+
+def append_record(record, path=None):
+    """Append a record to the store."""
+    path = path or DEFAULT_STORE
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    line = json.dumps(record, separators=(",", ":"))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+def load_records(path=None, **filters):
+    """Load records from the store, in the order that they were written.
+
+    Keyword arguments filter records on top-level fields, or on metadata
+    fields (e.g. ``adapter=...``). A filter value can be a plain value
+    or a callable that returns a bool.
+    """
+    path = path or DEFAULT_STORE
+    records = []
+    if not os.path.isfile(path):
+        return records
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # e.g. a partially written line from a killed run
+            if _matches(record, filters):
+                records.append(record)
+    return records
+
+
+def _matches(record, filters):
+    for key, expected in filters.items():
+        if key in record:
+            val = record[key]
+        else:
+            val = record.get("meta", {}).get(key)
+        if callable(expected):
+            if not expected(val):
+                return False
+        elif val != expected:
+            return False
+    return True
+
+
+def list_runs(path=None):
+    """Get a list of dicts describing the runs in the store, oldest first."""
+    runs = {}
+    for record in load_records(path):
+        run_id = record["run_id"]
+        if run_id not in runs:
+            meta = record.get("meta", {})
+            runs[run_id] = {
+                "run_id": run_id,
+                "timestamp": record["timestamp"],
+                "hostname": meta.get("hostname"),
+                "adapter": meta.get("adapter"),
+                "pygfx": meta.get("pygfx"),
+                "count": 0,
+            }
+        runs[run_id]["count"] += 1
+    return list(runs.values())
+
+
+def load_run(spec, path=None):
+    """Load the records of a single run.
+
+    The spec can be a run id (or a unique prefix of one), "latest",
+    "previous" (the run before the latest), or the path to a JSON Lines
+    file, in which case all records in that file are returned.
+    """
+    if spec.endswith(".jsonl") and os.path.isfile(spec):
+        return load_records(spec)
+
+    run_ids = [run["run_id"] for run in list_runs(path)]
+    if spec == "latest":
+        candidates = run_ids[-1:]
+    elif spec == "previous":
+        candidates = run_ids[-2:-1]
+    else:
+        candidates = [run_id for run_id in run_ids if run_id.startswith(spec)]
+
+    if not candidates:
+        raise ValueError(f"No run matching {spec!r}")
+    elif len(candidates) > 1:
+        raise ValueError(f"Ambiguous run {spec!r}, matches {candidates}")
+    return load_records(path, run_id=candidates[0])
+
+
+def record_key(record):
+    """Get a key to match records of the same benchmark between runs."""
+    return record["name"], json.dumps(record.get("params", {}), sort_keys=True)
@@ -10,7 +10,9 @@ from pygfx.renderers.wgpu.engine.update import (
 from pygfx.renderers.wgpu import get_shared
 
 from _benchmark import benchmark, run_all
-
+from _fixtures import get_array
+from _coalesce import get_cost_model, coalesce_indices
+from _staging import StagingPool, upload_buffers
 
 N = 100_000_000
 
@@ -20,12 +22,30 @@ def update_resource(resource):
     get_shared().device._poll()  # Wait for GPU to finish
 
 
+def upload_coalesced(buffer, indices, cost_model):
+    """Upload the given items of a buffer with queue.write_buffer(), in the
+    ranges chosen by the cost model, instead of in pygfx' chunks. The ranges
+    are taken from the buffer's data, so that the bytes that are added for
+    alignment are the real data too.
+    """
+    device = get_shared().device
+    data = buffer.data.reshape(-1).view(np.uint8)
+    offsets, sizes = coalesce_indices(
+        indices, buffer.itemsize, buffer.nbytes, cost_model
+    )
+    for offset, size in zip(offsets.tolist(), sizes.tolist()):
+        device.queue.write_buffer(
+            buffer._wgpu_object, offset, data[offset : offset + size]
+        )
+    device._poll()  # Wait for GPU to finish
+
+
 @benchmark(20)
 def upload_buffer_full_naive(canvas):
     # Emulate updating a pretty big buffer
 
-    data1 = np.zeros((N,), np.uint8)
-    data2 = np.ones((N,), np.uint8)
+    data1 = get_array(N, np.uint8, 0, writeable=True)
+    data2 = get_array(N, np.uint8, 1)
 
     buffer = gfx.Buffer(data1)
     ensure_wgpu_object(buffer)
@@ -44,8 +64,8 @@ def upload_buffer_full_naive(canvas):
 def upload_buffer_full_optimized(canvas):
     # Emulate updating a pretty big buffer, replacing full data if possible
 
-    data1 = np.zeros((N,), np.uint8)
-    data2 = np.ones((N,), np.uint8)
+    data1 = get_array(N, np.uint8, 0, writeable=True)
+    data2 = get_array(N, np.uint8, 1)
 
     buffer = gfx.Buffer(data1)
     ensure_wgpu_object(buffer)
@@ -68,8 +88,8 @@ def upload_buffer_full_optimized(canvas):
 def upload_buffer_full_noncont(canvas):
     # Emulate updating a pretty big buffer
 
-    data1 = np.zeros((N * 2,), np.uint8)[::2]
-    data2 = np.ones((N * 2,), np.uint8)[::2]
+    data1 = get_array(N, np.uint8, 0, step=2, writeable=True)
+    data2 = get_array(N, np.uint8, 1, step=2)
 
     buffer = gfx.Buffer(data1)
     ensure_wgpu_object(buffer)
@@ -91,8 +111,8 @@ def upload_buffer_full_noncont(canvas):
 def upload_buffer_half(canvas):
     # Emulate updating a pretty big buffer
 
-    data1 = np.zeros((N), np.uint8)
-    data2 = np.ones((N), np.uint8)
+    data1 = get_array(N, np.uint8, 0, writeable=True)
+    data2 = get_array(N, np.uint8, 1)
 
     buffer = gfx.Buffer(data1)
     ensure_wgpu_object(buffer)
@@ -115,8 +135,8 @@ def upload_buffer_half(canvas):
 def upload_buffer_two_quarters(canvas):
     # Emulate updating a pretty big buffer
 
-    data1 = np.zeros((N,), np.uint8)
-    data2 = np.ones((N,), np.uint8)
+    data1 = get_array(N, np.uint8, 0, writeable=True)
+    data2 = get_array(N, np.uint8, 1)
 
     buffer = gfx.Buffer(data1)
     ensure_wgpu_object(buffer)
@@ -140,8 +160,7 @@ def upload_buffer_two_quarters(canvas):
 def upload_buffer_chunk_stripes(canvas):
     # Emulate the worst-case stripe scenario
 
-    data1 = np.zeros((N,), np.uint8)
-    data2 = np.ones((N,), np.uint8)
+    data1 = get_array(N, np.uint8, 0)
 
     buffer = gfx.Buffer(data1)
     ensure_wgpu_object(buffer)
@@ -159,72 +178,63 @@ def upload_buffer_chunk_stripes(canvas):
         yield
 
 
-def upload_buffer_random(n_random):
+@benchmark(20)
+def upload_buffer_chunk_stripes_coalesced(canvas):
+    # Same as upload_buffer_chunk_stripes, but uploading coalesced ranges
 
-    data1 = np.zeros((N,), np.uint8)
+    data1 = get_array(N, np.uint8, 0)
 
     buffer = gfx.Buffer(data1)
     ensure_wgpu_object(buffer)
     update_resource(buffer)
 
+    step = buffer._chunk_size * 2  # every other chunk
+    cost_model = get_cost_model()
+
     yield
 
     while True:
-        ii = np.random.randint(0, N, n_random)
-        # tex.data[ii] = 1
-        buffer.update_indices(ii)
-        update_resource(buffer)
+        upload_coalesced(buffer, np.arange(0, N, step), cost_model)
         yield
 
 
-@benchmark(20)
-def upload_buffer_random8(canvas):
-    return upload_buffer_random(8)
-
-
-@benchmark(20)
-def upload_buffer_random16(canvas):
-    return upload_buffer_random(16)
-
-
-@benchmark(20)
-def upload_buffer_random32(canvas):
-    return upload_buffer_random(32)
-
-
-@benchmark(20)
-def upload_buffer_random64(canvas):
-    return upload_buffer_random(64)
-
+@benchmark(20, params={"n_random": [2**i for i in range(3, 13)]})
+def upload_buffer_random(canvas, n_random):
 
-@benchmark(20)
-def upload_buffer_random128(canvas):
-    return upload_buffer_random(128)
+    data1 = get_array(N, np.uint8, 0)
 
+    buffer = gfx.Buffer(data1)
+    ensure_wgpu_object(buffer)
+    update_resource(buffer)
 
-@benchmark(20)
-def upload_buffer_random256(canvas):
-    return upload_buffer_random(256)
+    yield
 
+    while True:
+        ii = np.random.randint(0, N, n_random)
+        # tex.data[ii] = 1
+        buffer.update_indices(ii)
+        update_resource(buffer)
+        yield
 
-@benchmark(20)
-def upload_buffer_random512(canvas):
-    return upload_buffer_random(512)
 
+@benchmark(20, params={"n_random": [2**i for i in range(3, 13)]})
+def upload_buffer_random_coalesced(canvas, n_random):
+    # Same as upload_buffer_random, but uploading coalesced ranges
 
-@benchmark(20)
-def upload_v_random1024(canvas):
-    return upload_buffer_random(1024)
+    data1 = get_array(N, np.uint8, 0)
 
+    buffer = gfx.Buffer(data1)
+    ensure_wgpu_object(buffer)
+    update_resource(buffer)
 
-@benchmark(20)
-def upload_buffer_random2048(canvas):
-    return upload_buffer_random(2048)
+    cost_model = get_cost_model()
 
+    yield
 
-@benchmark(20)
-def upload_buffer_random4096(canvas):
-    return upload_buffer_random(4096)
+    while True:
+        ii = np.random.randint(0, N, n_random)
+        upload_coalesced(buffer, ii, cost_model)
+        yield
 
 
 @benchmark(20)
@@ -233,8 +243,10 @@ def upload_100_buffers(canvas):
 
     buffers = []
     nbuffers = 100
+    n = N // nbuffers
+    data1 = get_array(N, np.uint8, 0)  # each buffer gets its own part
     for i in range(nbuffers):
-        data = np.zeros((N // nbuffers,), np.uint8)
+        data = data1[i * n : (i + 1) * n]
         buffer = gfx.Buffer(data)
         buffers.append(buffer)
 
@@ -252,5 +264,36 @@ def upload_100_buffers(canvas):
         yield
 
 
+@benchmark(
+    20,
+    params={"n_buffers": [10, 100, 1000, 10000], "upload": ["per_resource", "batched"]},
+)
+def upload_many_buffers(canvas, n_buffers, upload):
+    # Many small (uniform) buffers that all change each frame, uploaded
+    # per resource, or gathered into one staging buffer with one submit.
+
+    device = get_shared().device
+    data = get_array(64 * n_buffers, np.float32, 0)  # 256 bytes per buffer
+    buffers = [gfx.Buffer(data[i * 64 : (i + 1) * 64]) for i in range(n_buffers)]
+    for buffer in buffers:
+        ensure_wgpu_object(buffer)
+        update_resource(buffer)
+    pool = StagingPool(device)
+
+    yield
+
+    while True:
+
+        for buffer in buffers:
+            buffer.update_range()
+        if upload == "batched":
+            upload_buffers(device, buffers, pool)
+        else:
+            for buffer in buffers:
+                _update_resource(buffer)
+        device._poll()  # Wait for GPU to finish
+        yield
+
+
 if __name__ == "__main__":
     run_all(globals())
@@ -0,0 +1,359 @@
+"""
+Benchmarks for the Python-side bookkeeping of dirty chunks.
+
+When data is updated with ``update_indices()`` or ``update_range()``,
+pygfx marks the chunks that contain the changes in a boolean mask. At
+upload time, ``_gfx_get_chunk_descriptions()`` turns the mask into a list
+of (merged) chunks to copy. The chunksize benchmarks only measure the cost
+of the copies; this module measures the Python logic, without any GPU
+submission, for up to 10M indices per frame (e.g. random updates of many
+points).
+
+Each benchmark is run with the pygfx resource ("pygfx"), and with the
+ChunkTracker below ("numpy"), which marks chunks with ``np.bincount()``
+and finds runs of dirty chunks with ``np.diff()``, without Python loops.
+The "numpy_early" variant of the indices benchmarks stops marking as soon
+as all chunks are dirty. With random indices and a few dozen chunks, that
+is after the first block of indices, so it shows what such a shortcut
+saves, rather than the cost of the vectorized bookkeeping itself.
+The yielded dict splits the time into marking the chunks ("mark") and
+getting the descriptions ("describe").
+
+Note that for textures, pygfx merges blocks more aggressively (e.g. whole
+rows that are a quarter dirty), so the tracker can return more, but
+smaller, blocks for the same updates.
+"""
+
+import time
+
+import numpy as np
+import pygfx as gfx
+
+from _benchmark import benchmark, run_all
+from _fixtures import get_array
+
+BUFFER_SIZE = 2**24  # float32 items, i.e. 64 MB
+TEXTURE_SIZE_2D = (4096, 4096)  # uint8, i.e. 16 MB
+TEXTURE_SIZE_3D = (256, 256, 256)  # uint8, i.e. 16 MB
+
+
+class ChunkTracker:
+    """Keep track of dirty chunks with vectorized numpy operations.
+
+    The shape and chunk shape are in numpy order, e.g. (nitems,) for a
+    buffer, and (height, width) or (depth, height, width) for a texture.
+    With early_exit, marking indices stops when all chunks are dirty.
+    """
+
+    block_size = 2**16
+
+    def __init__(self, shape, chunk_shape, early_exit=False):
+        self._early_exit = early_exit
+        self._shape = np.array(shape, np.int64)
+        self._chunk_shape = np.array(chunk_shape, np.int64)
+        self._grid = tuple(int(n) for n in -(-self._shape // self._chunk_shape))
+        self._dirty = np.zeros(int(np.prod(self._grid)), bool)
+        self._shape_tuple = tuple(int(n) for n in shape)
+        self._chunk_tuple = tuple(int(c) for c in chunk_shape)
+
+    def _get_chunk_indices(self, indices, dim):
+        div = int(self._chunk_shape[dim])
+        indices = np.asarray(indices)
+        if div & (div - 1) == 0:
+            return indices >> (div.bit_length() - 1)  # a shift is cheaper
+        return indices // div
+
+    def update_indices(self, *indices):
+        """Mark the chunks of the given item indices, one array per dim.
+
+        The indices are processed in blocks, so that the intermediate arrays
+        stay small, and (with early_exit) so that it can stop as soon as all
+        chunks are dirty.
+        """
+        n = len(indices[0])
+        for i in range(0, n, self.block_size):
+            flat = self._get_chunk_indices(indices[0][i : i + self.block_size], 0)
+            for dim in range(1, len(indices)):
+                flat = flat * self._grid[dim]
+                flat += self._get_chunk_indices(
+                    indices[dim][i : i + self.block_size], dim
+                )
+            self._dirty |= np.bincount(flat, minlength=self._dirty.size) > 0
+            if self._early_exit and self._dirty.all():
+                break
+
+    def update_range(self, offset, size):
+        """Mark the chunks of a range, given as tuples of items per dim."""
+        index = tuple(
+            slice(o // c, -(-min(n, o + s) // c))
+            for o, s, n, c in zip(offset, size, self._shape_tuple, self._chunk_tuple)
+        )
+        self._dirty.reshape(self._grid)[index] = True
+
+    def get_chunk_descriptions(self):
+        """Get the blocks of dirty chunks as (offsets, sizes), two arrays
+        of shape (n, ndim) in items, and clear the dirty chunks.
+
+        Runs of dirty chunks along the last dimension are found first.
+        Runs that line up are then merged along the other dimensions, so
+        e.g. a fully dirty region of a texture becomes a single block.
+        """
+        dirty = self._dirty.reshape(self._grid)
+        padded = np.zeros(self._grid[:-1] + (self._grid[-1] + 2,), np.int8)
+        padded[..., 1:-1] = dirty
+        edges = np.diff(padded, axis=-1)
+        # Both are in row-major order, so the n-th start belongs to the n-th end
+        starts = np.argwhere(edges == 1)
+        ends = np.argwhere(edges == -1)
+        offsets = starts
+        counts = np.ones_like(starts)
+        counts[:, -1] = ends[:, -1] - starts[:, -1]
+        for dim in reversed(range(len(self._grid) - 1)):
+            offsets, counts = merge_blocks(offsets, counts, dim)
+        self._dirty.fill(False)
+
+        offsets = offsets * self._chunk_shape
+        sizes = np.minimum(counts * self._chunk_shape, self._shape - offsets)
+        return offsets, sizes
+
+
+def merge_blocks(offsets, counts, dim):
+    """Merge blocks that are adjacent along dim, and that have the same
+    offset and count in the other dimensions.
+    """
+    if len(offsets) < 2:
+        return offsets, counts
+    other = [i for i in range(offsets.shape[1]) if i != dim]
+    # Sort by the other dims, and then by the offset along dim
+    keys = [offsets[:, dim]] + [counts[:, i] for i in other]
+    keys += [offsets[:, i] for i in other]
+    order = np.lexsort(keys)
+    offsets, counts = offsets[order], counts[order]
+    same = np.all(offsets[1:, other] == offsets[:-1, other], axis=1)
+    same &= np.all(counts[1:, other] == counts[:-1, other], axis=1)
+    adjacent = same & (offsets[1:, dim] == offsets[:-1, dim] + counts[:-1, dim])
+    firsts = np.flatnonzero(np.concatenate([[True], ~adjacent]))
+    merged_counts = counts[firsts]
+    merged_counts[:, dim] = np.add.reduceat(counts[:, dim], firsts)
+    return offsets[firsts], merged_counts
+
+
+def get_random_indices(n_indices, shape):
+    """Get (deterministic) random indices into an array of the given shape,
+    one int32 array per dim.
+    """
+    rng = np.random.default_rng(0)
+    return tuple(rng.integers(0, n, n_indices, np.int32) for n in shape)
+
+
+def get_ranges(n_ranges, nitems):
+    """Get n_ranges (offset, size) tuples, evenly spread over nitems, that
+    together cover a quarter of the items.
+    """
+    step = nitems // n_ranges
+    return [(i * step, max(1, step // 4)) for i in range(n_ranges)]
+
+
+def time_bookkeeping(mark, describe):
+    """Time marking and describing the dirty chunks."""
+    t0 = time.perf_counter_ns()
+    mark()
+    t1 = time.perf_counter_ns()
+    describe()
+    t2 = time.perf_counter_ns()
+    return {"mark": t1 - t0, "describe": t2 - t1}
+
+
+indices_params = {
+    "n_indices": [10**3, 10**4, 10**5, 10**6, 10**7],
+    "tracker": ["pygfx", "numpy", "numpy_early"],
+}
+range_params = {"n_ranges": [10, 100, 1000, 10000], "tracker": ["pygfx", "numpy"]}
+
+
+@benchmark(20, kind="cpu", params=indices_params)
+def chunks_buffer_indices(canvas, n_indices, tracker):
+    # Random points of a large buffer change each frame
+
+    buffer = gfx.Buffer(get_array(BUFFER_SIZE, np.float32))
+    (indices,) = get_random_indices(n_indices, (BUFFER_SIZE,))
+    if tracker == "pygfx":
+
+        def mark():
+            buffer.update_indices(indices)
+
+        describe = buffer._gfx_get_chunk_descriptions
+    else:
+        chunk_tracker = ChunkTracker(
+            (BUFFER_SIZE,), (buffer._chunk_size,), tracker == "numpy_early"
+        )
+
+        def mark():
+            chunk_tracker.update_indices(indices)
+
+        describe = chunk_tracker.get_chunk_descriptions
+    describe()  # clear the initial full upload
+
+    yield
+
+    while True:
+        yield time_bookkeeping(mark, describe)
+
+
+@benchmark(20, kind="cpu", params=range_params)
+def chunks_buffer_ranges(canvas, n_ranges, tracker):
+    # Many small ranges of a large buffer change each frame
+
+    buffer = gfx.Buffer(get_array(BUFFER_SIZE, np.float32))
+    ranges = get_ranges(n_ranges, BUFFER_SIZE)
+    if tracker == "pygfx":
+        update_range = buffer.update_range
+        describe = buffer._gfx_get_chunk_descriptions
+    else:
+        chunk_tracker = ChunkTracker((BUFFER_SIZE,), (buffer._chunk_size,))
+
+        def update_range(offset, size):
+            chunk_tracker.update_range((offset,), (size,))
+
+        describe = chunk_tracker.get_chunk_descriptions
+    describe()
+
+    def mark():
+        for offset, size in ranges:
+            update_range(offset, size)
+
+    yield
+
+    while True:
+        yield time_bookkeeping(mark, describe)
+
+
+@benchmark(20, kind="cpu", params=indices_params)
+def chunks_texture2d_indices(canvas, n_indices, tracker):
+    # Random pixels of a large image change each frame
+
+    texture = gfx.Texture(get_array(TEXTURE_SIZE_2D, np.uint8), dim=2)
+    iy, ix = get_random_indices(n_indices, TEXTURE_SIZE_2D)
+    if tracker == "pygfx":
+
+        def mark():
+            texture.update_indices(ix, iy, None)
+
+        describe = texture._gfx_get_chunk_descriptions
+    else:
+        chunk_shape = texture._chunk_size[1::-1]  # (w, h, d) -> (h, w)
+        chunk_tracker = ChunkTracker(
+            TEXTURE_SIZE_2D, chunk_shape, tracker == "numpy_early"
+        )
+
+        def mark():
+            chunk_tracker.update_indices(iy, ix)
+
+        describe = chunk_tracker.get_chunk_descriptions
+    describe()
+
+    yield
+
+    while True:
+        yield time_bookkeeping(mark, describe)
+
+
+@benchmark(20, kind="cpu", params=range_params)
+def chunks_texture2d_ranges(canvas, n_ranges, tracker):
+    # Many rows of a large image change each frame
+
+    texture = gfx.Texture(get_array(TEXTURE_SIZE_2D, np.uint8), dim=2)
+    h, w = TEXTURE_SIZE_2D
+    rows = get_ranges(min(n_ranges, h), h)
+    if tracker == "pygfx":
+
+        def mark_row(y, n):
+            texture.update_range((0, y, 0), (w, n, 1))
+
+        describe = texture._gfx_get_chunk_descriptions
+    else:
+        chunk_tracker = ChunkTracker(TEXTURE_SIZE_2D, texture._chunk_size[1::-1])
+
+        def mark_row(y, n):
+            chunk_tracker.update_range((y, 0), (n, w))
+
+        describe = chunk_tracker.get_chunk_descriptions
+    describe()
+
+    def mark():
+        for y, n in rows:
+            mark_row(y, n)
+
+    yield
+
+    while True:
+        yield time_bookkeeping(mark, describe)
+
+
+@benchmark(20, kind="cpu", params=indices_params)
+def chunks_texture3d_indices(canvas, n_indices, tracker):
+    # Random voxels of a volume change each frame
+
+    texture = gfx.Texture(get_array(TEXTURE_SIZE_3D, np.uint8), dim=3)
+    iz, iy, ix = get_random_indices(n_indices, TEXTURE_SIZE_3D)
+    if tracker == "pygfx":
+
+        def mark():
+            texture.update_indices(ix, iy, iz)
+
+        describe = texture._gfx_get_chunk_descriptions
+    else:
+        chunk_shape = texture._chunk_size[::-1]  # (w, h, d) -> (d, h, w)
+        chunk_tracker = ChunkTracker(
+            TEXTURE_SIZE_3D, chunk_shape, tracker == "numpy_early"
+        )
+
+        def mark():
+            chunk_tracker.update_indices(iz, iy, ix)
+
+        describe = chunk_tracker.get_chunk_descriptions
+    describe()
+
+    yield
+
+    while True:
+        yield time_bookkeeping(mark, describe)
+
+
+@benchmark(20, kind="cpu", params=range_params)
+def chunks_texture3d_ranges(canvas, n_ranges, tracker):
+    # Many rows of voxels of a volume change each frame
+
+    texture = gfx.Texture(get_array(TEXTURE_SIZE_3D, np.uint8), dim=3)
+    d, h, w = TEXTURE_SIZE_3D
+    rows = []
+    for row, n in get_ranges(min(n_ranges, d * h), d * h):
+        z, y = divmod(row, h)
+        rows.append((z, y, min(n, h - y)))  # within one slice
+    if tracker == "pygfx":
+
+        def mark_rows(z, y, n):
+            texture.update_range((0, y, z), (w, n, 1))
+
+        describe = texture._gfx_get_chunk_descriptions
+    else:
+        chunk_tracker = ChunkTracker(TEXTURE_SIZE_3D, texture._chunk_size[::-1])
+
+        def mark_rows(z, y, n):
+            chunk_tracker.update_range((z, y, 0), (1, n, w))
+
+        describe = chunk_tracker.get_chunk_descriptions
+    describe()
+
+    def mark():
+        for z, y, n in rows:
+            mark_rows(z, y, n)
+
+    yield
+
+    while True:
+        yield time_bookkeeping(mark, describe)
+
+
+if __name__ == "__main__":
+    run_all(globals())
@@ -0,0 +1,151 @@
+"""
+Benchmarks for the latency from changing data until the change is visible.
+
+Each iteration changes the data of a resource (like an application would do
+when new samples come in), and then draws frames on the offscreen canvas
+until the change is detected in the rendered image. So the timed region
+covers the update of the resource, the upload, rendering, presenting, and
+reading the frame back. The yielded dict splits this up into the time to
+change the data ("update") and to draw and read back frames ("draw").
+Normally the change is visible in the first frame, but if not, more frames
+are drawn, and these count towards the latency.
+"""
+
+import time
+
+import numpy as np
+import pygfx as gfx
+
+from _benchmark import benchmark, run_all
+
+
+def draw_until(canvas, check, max_frames=10):
+    """Draw frames until check(image) returns True. Returns the number of
+    frames that were drawn. Raises an error if the change is not detected.
+    """
+    for i in range(max_frames):
+        image = np.asarray(canvas.draw())
+        if check(image):
+            return i + 1
+    raise RuntimeError(f"Change not detected after {max_frames} frames")
+
+
+def is_lit(image, rows=slice(None), cols=slice(None)):
+    """Get whether any pixel in the given region is not black."""
+    return bool(image[rows, cols, :3].max() > 127)
+
+
+def setup_scene(canvas, *objects):
+    renderer = gfx.WgpuRenderer(canvas)
+    scene = gfx.Scene()
+    scene.add(gfx.Background.from_color("#000"), *objects)
+    camera = gfx.OrthographicCamera(1000, 1000)
+    canvas.request_draw(lambda: renderer.render(scene, camera))
+    return renderer, scene, camera
+
+
+@benchmark(20, params={"n_points": [1000, 1_000_000]})
+def latency_buffer(canvas, n_points):
+
+    # A line of points, that jumps between the upper and lower half of the
+    # view, by setting all positions, e.g. like a signal with new samples.
+    x = np.linspace(-400, 400, n_points, dtype=np.float32)
+    positions = np.column_stack([x, np.zeros_like(x), np.zeros_like(x)])
+    geometry = gfx.Geometry(positions=positions)
+    points = gfx.Points(geometry, gfx.PointsMaterial(size=10, color="#fff"))
+    setup_scene(canvas, points)
+    canvas.draw()
+
+    h = np.asarray(canvas.draw()).shape[0]
+    upper, lower = slice(0, h // 2), slice(h // 2, h)
+    buffer = geometry.positions
+    up = True
+
+    yield
+
+    while True:
+        y = 250 if up else -250
+
+        t0 = time.perf_counter_ns()
+        buffer.data[:, 1] = y
+        buffer.update_range()
+        t1 = time.perf_counter_ns()
+        rows = upper if up else lower
+        draw_until(canvas, lambda im: is_lit(im, rows))
+        t2 = time.perf_counter_ns()
+
+        up = not up
+        yield {"update": t1 - t0, "draw": t2 - t1}
+
+
+@benchmark(20, params={"size": [256, 2048]})
+def latency_texture(canvas, size):
+
+    # An image that alternates between black and white, e.g. like a
+    # camera feed or a heatmap with new data.
+    data = np.zeros((size, size), np.uint8)
+    texture = gfx.Texture(data, dim=2)
+    image = gfx.Image(
+        gfx.Geometry(grid=texture),
+        gfx.ImageBasicMaterial(clim=(0, 255), interpolation="nearest"),
+    )
+    image.local.position = -500, -500, 0
+    image.local.scale = 1000 / size, 1000 / size, 1
+    setup_scene(canvas, image)
+    canvas.draw()
+
+    h, w = np.asarray(canvas.draw()).shape[:2]
+    center = slice(h // 2 - 2, h // 2 + 2), slice(w // 2 - 2, w // 2 + 2)
+    white = True
+
+    yield
+
+    while True:
+        value = 255 if white else 0
+
+        t0 = time.perf_counter_ns()
+        texture.data[:] = value
+        texture.update_range((0, 0, 0), texture.size)
+        t1 = time.perf_counter_ns()
+        draw_until(canvas, lambda im: is_lit(im, *center) == white)
+        t2 = time.perf_counter_ns()
+
+        white = not white
+        yield {"update": t1 - t0, "draw": t2 - t1}
+
+
+@benchmark(20, params={"n_chars": [10, 1000]})
+def latency_text(canvas, n_chars):
+
+    # A text that alternates between a short and a long version, e.g. like
+    # a label that shows a changing value. The long version extends into
+    # the right half of the view.
+    short_text = "x"
+    long_text = ("abcdefghij " * (n_chars // 10 + 1))[:n_chars]
+    geometry = gfx.TextGeometry(
+        text=short_text, font_size=40, anchor="middle-left", max_width=900
+    )
+    text = gfx.Text(geometry, gfx.TextMaterial(color="#fff"))
+    text.local.x = -450
+    setup_scene(canvas, text)
+    canvas.draw()
+
+    w = np.asarray(canvas.draw()).shape[1]
+    right = slice(w // 2 + 50, w)
+    long = True
+
+    yield
+
+    while True:
+        t0 = time.perf_counter_ns()
+        geometry.set_text(long_text if long else short_text)
+        t1 = time.perf_counter_ns()
+        draw_until(canvas, lambda im: is_lit(im, slice(None), right) == long)
+        t2 = time.perf_counter_ns()
+
+        long = not long
+        yield {"update": t1 - t0, "draw": t2 - t1}
+
+
+if __name__ == "__main__":
+    run_all(globals())
@@ -1,7 +1,7 @@
 import numpy as np
 import pygfx as gfx
 
-from _benchmark import benchmark, run_all
+from _benchmark import benchmark, run_all, enable_gpu_times, draw_frame_phases
 
 rng = np.random.default_rng()
 
@@ -13,12 +13,30 @@ five_clipping_planes = rng.random((5, 4), dtype="float32").tolist()
 twenty_clipping_planes = rng.random((20, 4), dtype="float32").tolist()
 
 
+@benchmark(
+    params={
+        # A couple of measurements of 100k points, divided over multiple
+        # objects, a simple case, and a case of drawing 1M.
+        ("n_objects", "n_verts"): [
+            (1, 100_000),
+            (100, 1000),
+            (1000, 100),
+            (10, 10),
+            (1, 1_000_000),
+        ],
+        "clipping_planes": {
+            "none": None,
+            "five": five_clipping_planes,
+            "twenty": twenty_clipping_planes,
+        },
+    }
+)
 def benchmark_points(canvas, n_objects, n_verts, *, clipping_planes=None):
     if clipping_planes is None:
         clipping_planes = []
 
     renderer = gfx.WgpuRenderer(canvas, blend_mode="ordered2")
-    renderer.measure_gpu_times = True
+    enable_gpu_times(renderer)
 
     scene = gfx.Scene()
 
@@ -47,116 +65,7 @@ def benchmark_points(canvas, n_objects, n_verts, *, clipping_planes=None):
     yield None
 
     while True:
-        canvas._draw_frame_and_present()  # includes time to take screenshot
-        yield  # renderer.stats["gpu_times"]
-
-
-# A couple of measurements of 100k points, divided over multiple objects
-
-
-@benchmark
-def benchmark_points_1_100k(canvas):
-    # 1 points object with 100000 points
-    yield from benchmark_points(canvas, 1, 100_000)
-
-
-@benchmark
-def benchmark_points_1_100k_five_clipping_planes(canvas):
-    # 1 points object with 100000 points
-    yield from benchmark_points(
-        canvas, 1, 100_000, clipping_planes=five_clipping_planes
-    )
-
-
-@benchmark
-def benchmark_points_1_100k_twenty_clipping_planes(canvas):
-    # 1 points object with 100000 points
-    yield from benchmark_points(
-        canvas, 1, 100_000, clipping_planes=twenty_clipping_planes
-    )
-
-
-@benchmark
-def benchmark_points_100_1000(canvas):
-    # 100 points objects with 1000 points each
-    yield from benchmark_points(canvas, 100, 1000)
-
-
-@benchmark
-def benchmark_points_100_1000_five_clipping_planes(canvas):
-    # 100 points objects with 1000 points each
-    yield from benchmark_points(canvas, 100, 1000, clipping_planes=five_clipping_planes)
-
-
-@benchmark
-def benchmark_points_100_1000_twenty_clipping_planes(canvas):
-    # 100 points objects with 1000 points each
-    yield from benchmark_points(
-        canvas, 100, 1000, clipping_planes=twenty_clipping_planes
-    )
-
-
-@benchmark
-def benchmark_points_1000_100(canvas):
-    # 1000 points objects with 100 points each
-    yield from benchmark_points(canvas, 1000, 100)
-
-
-@benchmark
-def benchmark_points_1000_100_five_clipping_planes(canvas):
-    # 1000 points objects with 100 points each
-    yield from benchmark_points(canvas, 1000, 100, clipping_planes=five_clipping_planes)
-
-
-@benchmark
-def benchmark_points_1000_100_twenty_clipping_planes(canvas):
-    # 1000 points objects with 100 points each
-    yield from benchmark_points(
-        canvas, 1000, 100, clipping_planes=twenty_clipping_planes
-    )
-
-
-# A simple case, and a case of drawing 1M
-
-
-@benchmark
-def benchmark_points_10_10(canvas):
-    # 10 points objects with 10 points each
-    yield from benchmark_points(canvas, 10, 10)
-
-
-@benchmark
-def benchmark_points_10_10_five_clipping_planes(canvas):
-    # 10 points objects with 10 points each
-    yield from benchmark_points(canvas, 10, 10, clipping_planes=five_clipping_planes)
-
-
-@benchmark
-def benchmark_points_10_10_twenty_clipping_planes(canvas):
-    # 10 points objects with 10 points each
-    yield from benchmark_points(canvas, 10, 10, clipping_planes=twenty_clipping_planes)
-
-
-@benchmark
-def benchmark_points_1_1m(canvas):
-    # 1 points object with 1mpoints
-    yield from benchmark_points(canvas, 1, 1_000_000)
-
-
-@benchmark
-def benchmark_points_1_1m_five_clipping_planes(canvas):
-    # 1 points object with 1mpoints
-    yield from benchmark_points(
-        canvas, 1, 1_000_000, clipping_planes=five_clipping_planes
-    )
-
-
-@benchmark
-def benchmark_points_1_1m_twenty_clipping_planes(canvas):
-    # 1 points object with 1mpoints
-    yield from benchmark_points(
-        canvas, 1, 1_000_000, clipping_planes=twenty_clipping_planes
-    )
+        yield draw_frame_phases(canvas)
 
 
 if __name__ == "__main__":
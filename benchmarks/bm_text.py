@@ -3,7 +3,7 @@ import random
 import numpy as np
 import pygfx as gfx
 
-from _benchmark import benchmark, run_all
+from _benchmark import benchmark, run_all, enable_gpu_times, draw_frame_phases
 
 
 big_text = """
@@ -32,6 +32,7 @@ Eleifend imperdiet primis quam conubia sapien lacus nec sagittis curabitur. Dapi
 def benchmark_large_static_text(canvas):
 
     renderer = gfx.WgpuRenderer(canvas, blend_mode="ordered1")
+    enable_gpu_times(renderer)
 
     scene = gfx.Scene()
 
@@ -53,11 +54,10 @@ def benchmark_large_static_text(canvas):
     yield None
 
     while True:
-        canvas._draw_frame_and_present()  # includes time to take screenshot
-        yield  # renderer.stats["gpu_times"]
+        yield draw_frame_phases(canvas)
 
 
-@benchmark
+@benchmark(kind="cpu")  # only text layout is timed
 def benchmark_changing_one_word_in_big_text(canvas):
 
     renderer = gfx.WgpuRenderer(canvas, blend_mode="ordered1")
@@ -90,7 +90,7 @@ def benchmark_changing_one_word_in_big_text(canvas):
         yield
 
 
-@benchmark(1000)
+@benchmark(1000, kind="cpu")  # only text layout is timed
 def benchmark_changing_one_word_in_small_text(canvas):
 
     renderer = gfx.WgpuRenderer(canvas, blend_mode="ordered1")
@@ -186,6 +186,7 @@ def benchmark_multi_text(canvas, use_multi_text):
     camera.show_object(scene)
 
     renderer = gfx.renderers.WgpuRenderer(canvas)
+    enable_gpu_times(renderer)
     controller = gfx.OrbitController(camera, register_events=renderer)
 
     renderer.request_draw(lambda: renderer.render(scene, camera))
@@ -196,8 +197,7 @@ def benchmark_multi_text(canvas, use_multi_text):
     yield None
 
     while True:
-        canvas._draw_frame_and_present()  # includes time to take screenshot
-        yield  # renderer.stats["gpu_times"]
+        yield draw_frame_phases(canvas)
 
 
 
@@ -10,6 +10,7 @@ from pygfx.renderers.wgpu.engine.update import (
 from pygfx.renderers.wgpu import get_shared
 
 from _benchmark import benchmark, run_all
+from _fixtures import get_array
 
 
 def update_resource(resource):
@@ -27,8 +28,8 @@ N1 = 16384  # max texture size
 def upload_tex1d_full_naive(canvas):
     # Emulate updating a texture in full, but the silly way
 
-    data1 = np.zeros((N1, 4), np.float32)
-    data2 = np.ones((N1, 4), np.float32)
+    data1 = get_array((N1, 4), np.float32, 0, writeable=True)
+    data2 = get_array((N1, 4), np.float32, 1)
 
     tex = gfx.Texture(data1, dim=1)
     ensure_wgpu_object(tex)
@@ -47,8 +48,8 @@ def upload_tex1d_full_naive(canvas):
 def upload_tex1d_full_optimized(canvas):
     # Emulate updating a texture im full, the proper way
 
-    data1 = np.zeros((N1, 4), np.float32)
-    data2 = np.zeros((N1, 4), np.float32)
+    data1 = get_array((N1, 4), np.float32, 0, writeable=True)
+    data2 = get_array((N1, 4), np.float32, 0)
 
     tex = gfx.Texture(data1, dim=1)
     ensure_wgpu_object(tex)
@@ -71,8 +72,8 @@ def upload_tex1d_full_optimized(canvas):
 def upload_tex1d_full_noncont(canvas):
     # Emulate updating a texture im full, with non-contiguous data
 
-    data1 = np.zeros((N1 * 2, 4), np.float32)[::2]
-    data2 = np.ones((N1 * 2, 4), np.float32)[::2]
+    data1 = get_array((N1, 4), np.float32, 0, step=2, writeable=True)
+    data2 = get_array((N1, 4), np.float32, 1, step=2)
 
     tex = gfx.Texture(data1, dim=1)
     ensure_wgpu_object(tex)
@@ -94,7 +95,7 @@ def upload_tex1d_full_noncont(canvas):
 def upload_tex1d_quarter_x(canvas):
     # Emulate updating quarter of the texture data
 
-    data1 = np.zeros((N1, 4), np.float32)
+    data1 = get_array((N1, 4), np.float32, 0)
 
     n = N1 // 4
 
@@ -117,7 +118,7 @@ def upload_tex1d_quarter_x(canvas):
 def upload_tex1d_two_eights_x(canvas):
     # Emulate updating two eights of texture data
 
-    data1 = np.zeros((N1, 4), np.float32)
+    data1 = get_array((N1, 4), np.float32, 0)
 
     n = N1 // 8
 
@@ -152,8 +153,8 @@ N2 = 4000
 @benchmark(20)
 def upload_tex2d_full_naive(canvas):
 
-    data1 = np.zeros((N2, N2, 4), np.uint8)
-    data2 = np.ones((N2, N2, 4), np.uint8)
+    data1 = get_array((N2, N2, 4), np.uint8, 0, writeable=True)
+    data2 = get_array((N2, N2, 4), np.uint8, 1)
 
     tex = gfx.Texture(data1, dim=2)
     ensure_wgpu_object(tex)
@@ -171,8 +172,8 @@ def upload_tex2d_full_naive(canvas):
 @benchmark(20)
 def upload_tex2d_full_optimized(canvas):
 
-    data1 = np.zeros((N2, N2, 4), np.uint8)
-    data2 = np.zeros((N2, N2, 4), np.uint8)
+    data1 = get_array((N2, N2, 4), np.uint8, 0, writeable=True)
+    data2 = get_array((N2, N2, 4), np.uint8, 0)
 
     tex = gfx.Texture(data1, dim=2)
     ensure_wgpu_object(tex)
@@ -194,8 +195,8 @@ def upload_tex2d_full_optimized(canvas):
 @benchmark(20)
 def upload_tex2d_full_noncont(canvas):
 
-    data1 = np.zeros((N2 * 2, N2 * 2, 4), np.uint8)[::2, ::2]
-    data2 = np.ones((N2 * 2, N2 * 2, 4), np.uint8)[::2, ::2]
+    data1 = get_array((N2, N2, 4), np.uint8, 0, step=(2, 2), writeable=True)
+    data2 = get_array((N2, N2, 4), np.uint8, 1, step=(2, 2))
 
     tex = gfx.Texture(data1, dim=2)
     ensure_wgpu_object(tex)
@@ -216,7 +217,7 @@ def upload_tex2d_full_noncont(canvas):
 @benchmark(20)
 def upload_tex2d_quarter_x(canvas):
 
-    data1 = np.zeros((N2, N2, 4), np.uint8)
+    data1 = get_array((N2, N2, 4), np.uint8, 0)
 
     n = N2 // 4
     tex = gfx.Texture(data1, dim=2)
@@ -237,7 +238,7 @@ def upload_tex2d_quarter_x(canvas):
 @benchmark(20)
 def upload_tex2d_quarter_y(canvas):
 
-    data1 = np.zeros((N2, N2, 4), np.uint8)
+    data1 = get_array((N2, N2, 4), np.uint8, 0)
 
     n = N2 // 4
     tex = gfx.Texture(data1, dim=2)
@@ -258,7 +259,7 @@ def upload_tex2d_quarter_y(canvas):
 @benchmark(20)
 def upload_tex2d_two_eights_x(canvas):
 
-    data1 = np.zeros((N2, N2, 4), np.uint8)
+    data1 = get_array((N2, N2, 4), np.uint8, 0)
 
     n = N2 // 8
     tex = gfx.Texture(data1, dim=2)
@@ -280,7 +281,7 @@ def upload_tex2d_two_eights_x(canvas):
 @benchmark(20)
 def upload_tex2d_two_eights_y(canvas):
 
-    data1 = np.zeros((N2, N2, 4), np.uint8)
+    data1 = get_array((N2, N2, 4), np.uint8, 0)
 
     n = N2 // 8
     tex = gfx.Texture(data1, dim=2)
@@ -302,7 +303,7 @@ def upload_tex2d_two_eights_y(canvas):
 @benchmark(20)
 def upload_tex2d_four_eights_x(canvas):
 
-    data1 = np.zeros((N2, N2, 4), np.uint8)
+    data1 = get_array((N2, N2, 4), np.uint8, 0)
 
     n = N2 // 8
     tex = gfx.Texture(data1, dim=2)
@@ -324,7 +325,7 @@ def upload_tex2d_four_eights_x(canvas):
 @benchmark(20)
 def upload_tex2d_four_eights_y(canvas):
 
-    data1 = np.zeros((N2, N2, 4), np.uint8)
+    data1 = get_array((N2, N2, 4), np.uint8, 0)
 
     n = N2 // 8
     tex = gfx.Texture(data1, dim=2)
@@ -347,13 +348,13 @@ def upload_tex2d_four_eights_y(canvas):
 def upload_tex2d_chunk_stripes_x(canvas):
     # Emulate the worst-case stripe scenario
 
-    data1 = np.zeros((N2, N2, 4), np.uint8)
+    data1 = get_array((N2, N2, 4), np.uint8, 0)
 
     tex = gfx.Texture(data1, dim=2)
     ensure_wgpu_object(tex)
     update_resource(tex)
 
-    if hasattr(tex, '_chunk_size'):
+    if hasattr(tex, "_chunk_size"):
         chunk_size = tex._chunk_size[1]
     else:
         chunk_size = (800, 1000, 1)
@@ -371,13 +372,13 @@ def upload_tex2d_chunk_stripes_x(canvas):
 def upload_tex2d_chunk_stripes_y(canvas):
     # Emulate the worst-case stripe scenario
 
-    data1 = np.zeros((N2, N2, 4), np.uint8)
+    data1 = get_array((N2, N2, 4), np.uint8, 0)
 
     tex = gfx.Texture(data1, dim=2)
     ensure_wgpu_object(tex)
     update_resource(tex)
 
-    if hasattr(tex, '_chunk_size'):
+    if hasattr(tex, "_chunk_size"):
         chunk_size = tex._chunk_size[1]
     else:
         chunk_size = (800, 1000, 1)
@@ -391,9 +392,10 @@ def upload_tex2d_chunk_stripes_y(canvas):
         yield
 
 
-def upload_tex2d_random(n_random):
+@benchmark(20, params={"n_random": [2**i for i in range(3, 12)]})
+def upload_tex2d_random(canvas, n_random):
 
-    data1 = np.zeros((N2, N2, 4), np.uint8)
+    data1 = get_array((N2, N2, 4), np.uint8, 0)
 
     tex = gfx.Texture(data1, dim=2)
     ensure_wgpu_object(tex)
@@ -410,58 +412,13 @@ def upload_tex2d_random(n_random):
         yield
 
 
-@benchmark(20)
-def upload_tex2d_random8(canvas):
-    return upload_tex2d_random(8)
-
-
-@benchmark(20)
-def upload_tex2d_random16(canvas):
-    return upload_tex2d_random(16)
-
-
-@benchmark(20)
-def upload_tex2d_random32(canvas):
-    return upload_tex2d_random(32)
-
-
-@benchmark(20)
-def upload_tex2d_random64(canvas):
-    return upload_tex2d_random(64)
-
-
-@benchmark(20)
-def upload_tex2d_random128(canvas):
-    return upload_tex2d_random(128)
-
-
-@benchmark(20)
-def upload_tex2d_random256(canvas):
-    return upload_tex2d_random(256)
-
-
-@benchmark(20)
-def upload_tex2d_random512(canvas):
-    return upload_tex2d_random(512)
-
-
-@benchmark(20)
-def upload_tex2d_random1024(canvas):
-    return upload_tex2d_random(1024)
-
-
-@benchmark(20)
-def upload_tex2d_random2048(canvas):
-    return upload_tex2d_random(2048)
-
-
 @benchmark(20)
 def upload_tex2d_100_textures(canvas):
     # This emulates uploading a bunch of small textures.
     # The purpose is to measure chunking overhead.
     n = N2 // 10
 
-    data1 = np.zeros((n, n, 4), np.uint8)
+    data1 = get_array((n, n, 4), np.uint8, 0)
 
     textures = [gfx.Texture(data1, dim=2) for i in range(100)]
 
@@ -494,8 +451,8 @@ SHAPE3 = 500, 500, 500
 @benchmark(20)
 def upload_tex3d_full_naive(canvas):
 
-    data1 = np.zeros(SHAPE3, np.uint8)
-    data2 = np.ones(SHAPE3, np.uint8)
+    data1 = get_array(SHAPE3, np.uint8, 0, writeable=True)
+    data2 = get_array(SHAPE3, np.uint8, 1)
 
     tex = gfx.Texture(data1, dim=3)
     ensure_wgpu_object(tex)
@@ -513,8 +470,8 @@ def upload_tex3d_full_naive(canvas):
 @benchmark(20)
 def upload_tex3d_full_optimized(canvas):
 
-    data1 = np.zeros(SHAPE3, np.uint8)
-    data2 = np.zeros(SHAPE3, np.uint8)
+    data1 = get_array(SHAPE3, np.uint8, 0, writeable=True)
+    data2 = get_array(SHAPE3, np.uint8, 0)
 
     tex = gfx.Texture(data1, dim=3)
     ensure_wgpu_object(tex)
@@ -536,12 +493,8 @@ def upload_tex3d_full_optimized(canvas):
 @benchmark(20)
 def upload_tex3d_full_noncont(canvas):
 
-    data1 = np.zeros((SHAPE3[0] * 2, SHAPE3[1] * 2, SHAPE3[2] * 2), np.uint8)[
-        ::2, ::2, ::2
-    ]
-    data2 = np.ones((SHAPE3[0] * 2, SHAPE3[1] * 2, SHAPE3[2] * 2), np.uint8)[
-        ::2, ::2, ::2
-    ]
+    data1 = get_array(SHAPE3, np.uint8, 0, step=(2, 2, 2), writeable=True)
+    data2 = get_array(SHAPE3, np.uint8, 1, step=(2, 2, 2))
 
     tex = gfx.Texture(data1, dim=3)
     ensure_wgpu_object(tex)
@@ -562,7 +515,7 @@ def upload_tex3d_full_noncont(canvas):
 @benchmark(20)
 def upload_tex3d_quarter_x(canvas):
 
-    data1 = np.zeros(SHAPE3, np.uint8)
+    data1 = get_array(SHAPE3, np.uint8, 0)
 
     n = SHAPE3[2] // 4
     tex = gfx.Texture(data1, dim=3)
@@ -583,7 +536,7 @@ def upload_tex3d_quarter_x(canvas):
 @benchmark(20)
 def upload_tex3d_quarter_y(canvas):
 
-    data1 = np.zeros(SHAPE3, np.uint8)
+    data1 = get_array(SHAPE3, np.uint8, 0)
 
     n = SHAPE3[1] // 4
     tex = gfx.Texture(data1, dim=3)
@@ -604,7 +557,7 @@ def upload_tex3d_quarter_y(canvas):
 @benchmark(20)
 def upload_tex3d_quarter_z(canvas):
 
-    data1 = np.zeros(SHAPE3, np.uint8)
+    data1 = get_array(SHAPE3, np.uint8, 0)
 
     n = SHAPE3[0] // 4
     tex = gfx.Texture(data1, dim=3)
@@ -625,7 +578,7 @@ def upload_tex3d_quarter_z(canvas):
 @benchmark(20)
 def upload_tex3d_two_eights_x(canvas):
 
-    data1 = np.zeros(SHAPE3, np.uint8)
+    data1 = get_array(SHAPE3, np.uint8, 0)
 
     n = SHAPE3[2] // 8
     tex = gfx.Texture(data1, dim=3)
@@ -647,7 +600,7 @@ def upload_tex3d_two_eights_x(canvas):
 @benchmark(20)
 def upload_tex3d_two_eights_y(canvas):
 
-    data1 = np.zeros(SHAPE3, np.uint8)
+    data1 = get_array(SHAPE3, np.uint8, 0)
 
     n = SHAPE3[1] // 8
     tex = gfx.Texture(data1, dim=3)
@@ -669,7 +622,7 @@ def upload_tex3d_two_eights_y(canvas):
 @benchmark(20)
 def upload_tex3d_two_eights_z(canvas):
 
-    data1 = np.zeros(SHAPE3, np.uint8)
+    data1 = get_array(SHAPE3, np.uint8, 0)
 
     n = SHAPE3[0] // 8
     tex = gfx.Texture(data1, dim=3)
@@ -691,7 +644,7 @@ def upload_tex3d_two_eights_z(canvas):
 @benchmark(20)
 def upload_tex3d_four_eights_x(canvas):
 
-    data1 = np.zeros(SHAPE3, np.uint8)
+    data1 = get_array(SHAPE3, np.uint8, 0)
 
     n = SHAPE3[2] // 8
     tex = gfx.Texture(data1, dim=3)
@@ -713,7 +666,7 @@ def upload_tex3d_four_eights_x(canvas):
 @benchmark(20)
 def upload_tex3d_four_eights_y(canvas):
 
-    data1 = np.zeros(SHAPE3, np.uint8)
+    data1 = get_array(SHAPE3, np.uint8, 0)
 
     n = SHAPE3[1] // 8
     tex = gfx.Texture(data1, dim=3)
@@ -735,7 +688,7 @@ def upload_tex3d_four_eights_y(canvas):
 @benchmark(20)
 def upload_tex3d_four_eights_z(canvas):
 
-    data1 = np.zeros(SHAPE3, np.uint8)
+    data1 = get_array(SHAPE3, np.uint8, 0)
 
     n = SHAPE3[0] // 8
     tex = gfx.Texture(data1, dim=3)
@@ -758,13 +711,13 @@ def upload_tex3d_four_eights_z(canvas):
 def upload_tex3d_chunk_stripes_x(canvas):
     # Emulate the worst-case stripe scenario
 
-    data1 = np.zeros(SHAPE3, np.uint8)
+    data1 = get_array(SHAPE3, np.uint8, 0)
 
     tex = gfx.Texture(data1, dim=3)
     ensure_wgpu_object(tex)
     update_resource(tex)
 
-    if hasattr(tex, '_chunk_size'):
+    if hasattr(tex, "_chunk_size"):
         chunk_size = tex._chunk_size
     else:
         chunk_size = (176, 167, 167)
@@ -782,13 +735,13 @@ def upload_tex3d_chunk_stripes_x(canvas):
 def upload_tex3d_chunk_stripes_y(canvas):
     # Emulate the worst-case stripe scenario
 
-    data1 = np.zeros(SHAPE3, np.uint8)
+    data1 = get_array(SHAPE3, np.uint8, 0)
 
     tex = gfx.Texture(data1, dim=3)
     ensure_wgpu_object(tex)
     update_resource(tex)
 
-    if hasattr(tex, '_chunk_size'):
+    if hasattr(tex, "_chunk_size"):
         chunk_size = tex._chunk_size
     else:
         chunk_size = (176, 167, 167)
@@ -806,13 +759,13 @@ def upload_tex3d_chunk_stripes_y(canvas):
 def upload_tex3d_chunk_stripes_z(canvas):
     # Emulate the worst-case stripe scenario
 
-    data1 = np.zeros(SHAPE3, np.uint8)
+    data1 = get_array(SHAPE3, np.uint8, 0)
 
     tex = gfx.Texture(data1, dim=3)
     ensure_wgpu_object(tex)
     update_resource(tex)
 
-    if hasattr(tex, '_chunk_size'):
+    if hasattr(tex, "_chunk_size"):
         chunk_size = tex._chunk_size
     else:
         chunk_size = (176, 167, 167)
@@ -826,9 +779,10 @@ def upload_tex3d_chunk_stripes_z(canvas):
         yield
 
 
-def upload_tex3d_random(n_random):
+@benchmark(20, params={"n_random": [2**i for i in range(3, 13)]})
+def upload_tex3d_random(canvas, n_random):
 
-    data1 = np.zeros(SHAPE3, np.uint8)
+    data1 = get_array(SHAPE3, np.uint8, 0)
 
     tex = gfx.Texture(data1, dim=3)
     ensure_wgpu_object(tex)
@@ -846,56 +800,6 @@ def upload_tex3d_random(n_random):
         yield
 
 
-@benchmark(20)
-def upload_tex3d_random8(canvas):
-    return upload_tex3d_random(8)
-
-
-@benchmark(20)
-def upload_tex3d_random16(canvas):
-    return upload_tex3d_random(16)
-
-
-@benchmark(20)
-def upload_tex3d_random32(canvas):
-    return upload_tex3d_random(32)
-
-
-@benchmark(20)
-def upload_tex3d_random64(canvas):
-    return upload_tex3d_random(64)
-
-
-@benchmark(20)
-def upload_tex3d_random128(canvas):
-    return upload_tex3d_random(128)
-
-
-@benchmark(20)
-def upload_tex3d_random256(canvas):
-    return upload_tex3d_random(256)
-
-
-@benchmark(20)
-def upload_tex3d_random512(canvas):
-    return upload_tex3d_random(512)
-
-
-@benchmark(20)
-def upload_tex3d_random1024(canvas):
-    return upload_tex3d_random(1024)
-
-
-@benchmark(20)
-def upload_tex3d_random2048(canvas):
-    return upload_tex3d_random(2048)
-
-
-@benchmark(20)
-def upload_tex3d_random4096(canvas):
-    return upload_tex3d_random(4096)
-
-
 if __name__ == "__main__":
     run_all(globals())
 
@@ -907,14 +811,14 @@ if __name__ == "__main__":
     # upload_tex2d_chunk_stripes_x(None)
     # upload_tex2d_chunk_stripes_y(None)
 
-    # upload_tex2d_random32(None)
-    # upload_tex2d_random64(None)
-    # upload_tex2d_random128(None)
-    # upload_tex2d_random256(None)
-    # upload_tex2d_random512(None)
-    # upload_tex2d_random1024(None)
-    # upload_tex2d_random1024(None)
-    # upload_tex2d_random2048(None)
+    # upload_tex2d_random(None, n_random=32)
+    # upload_tex2d_random(None, n_random=64)
+    # upload_tex2d_random(None, n_random=128)
+    # upload_tex2d_random(None, n_random=256)
+    # upload_tex2d_random(None, n_random=512)
+    # upload_tex2d_random(None, n_random=1024)
+    # upload_tex2d_random(None, n_random=1024)
+    # upload_tex2d_random(None, n_random=2048)
     #
     # print("---")
     #
@@ -932,12 +836,11 @@ if __name__ == "__main__":
     # upload_tex3d_chunk_stripes_y(None)
     # upload_tex3d_chunk_stripes_z(None)
 
-    # upload_tex3d_random32(None)
-    # upload_tex3d_random64(None)
-    # upload_tex3d_random128(None)
-    # upload_tex3d_random256(None)
-    # upload_tex3d_random512(None)
-    # upload_tex3d_random1024(None)
-    # upload_tex3d_random2048(None)
-    # upload_tex3d_random4096(None)
-
+    # upload_tex3d_random(None, n_random=32)
+    # upload_tex3d_random(None, n_random=64)
+    # upload_tex3d_random(None, n_random=128)
+    # upload_tex3d_random(None, n_random=256)
+    # upload_tex3d_random(None, n_random=512)
+    # upload_tex3d_random(None, n_random=1024)
+    # upload_tex3d_random(None, n_random=2048)
+    # upload_tex3d_random(None, n_random=4096)
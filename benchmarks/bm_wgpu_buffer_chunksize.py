@@ -12,9 +12,20 @@ There are various parameters that affect performance:
 I hope to get an indication of the optimal chunk size, perhaps depending
 on one of the other parameters, though ideally a value that works good
 (enough) accross the spectrum.
+
+Run with ``--optimize`` to search for the optimal chunk size per buffer
+size and upload method, instead of running the benchmarks for all chunk
+sizes. The result is a JSON table for the current adapter, including a
+cost model (cost per copy and per byte) for _coalesce.py.
+
+Run with ``--large`` to run the benchmarks for buffers of 1 GB and more
+(as far as the device supports), instead of the default sizes.
 """
 
+import sys
+import json
 import time
+import argparse
 
 import numpy as np
 import wgpu
@@ -25,7 +36,9 @@ from pygfx.renderers.wgpu.engine.update import (
 )
 from pygfx.renderers.wgpu import get_shared
 
-from _benchmark import benchmark, run_all
+from _benchmark import benchmark, get_device, run_all, warmup
+from _stats import mann_whitney_u
+from _coalesce import fit_cost_model
 
 
 def update_resource(resource):
@@ -33,14 +46,42 @@ def update_resource(resource):
     get_shared().device._poll()  # Wait for GPU to finish
 
 
-# Global device
-device = wgpu.gpu.request_adapter(power_preference="high-performance").request_device()
-print(device.adapter.summary)
+print(get_device().adapter.summary)
 
 ##
 
 
-def up_wbuf_queue_write(buffer_size, chunk_size):
+def get_grid(sizes):
+    """Get the (buffer_size2, chunk_size2) cases for (log2) buffer sizes
+    and the chunk sizes to explore for each.
+    """
+    return {
+        ("buffer_size2", "chunk_size2"): [
+            (buffer_size2, chunk_size2)
+            for buffer_size2, chunk_sizes2 in sizes
+            for chunk_size2 in chunk_sizes2
+        ]
+    }
+
+
+# The (log2) buffer sizes and chunk sizes to explore, as in
+# results/bm_wgpu_buffer_chunksize.md. The large sizes need GBs of memory
+# and can exceed the max buffer size of the device, so these are only
+# explored with ``--large``.
+SIZES = [
+    (15, range(6, 17)),
+    (20, range(10, 21)),
+    (25, range(12, 23)),
+    (28, range(14, 25)),
+]
+LARGE_SIZES = [(30, range(17, 31)), (31, range(18, 31)), (32, range(19, 32))]
+
+
+@benchmark(20, params=get_grid(SIZES))
+def up_wbuf_queue_write(canvas, buffer_size2, chunk_size2):
+    device = get_device()
+
+    buffer_size, chunk_size = 2**buffer_size2, 2**chunk_size2
 
     data1 = np.ones((buffer_size,), np.uint8)
 
@@ -67,7 +108,11 @@ def up_wbuf_queue_write(buffer_size, chunk_size):
         yield
 
 
-def up_wbuf_write_mapped(buffer_size, chunk_size):
+@benchmark(20, params=get_grid(SIZES))
+def up_wbuf_write_mapped(canvas, buffer_size2, chunk_size2):
+    device = get_device()
+
+    buffer_size, chunk_size = 2**buffer_size2, 2**chunk_size2
 
     data1 = np.ones((buffer_size,), np.uint8)
 
@@ -110,38 +155,145 @@ def up_wbuf_write_mapped(buffer_size, chunk_size):
 ##
 
 
-def create_benchmark(func, buffer_size2, chunk_size2):
-
-    def wrapper():
-        return func(2**buffer_size2, 2**chunk_size2)
-
-    wrapper.__name__ = func.__name__ + f"_{buffer_size2}_{chunk_size2}"
-    return benchmark(20)(wrapper)
-
-
-def run_benchmarks(func, buffer_size2, chunk_size2_start, chunk_size2_end):
-    for chunk_size2 in range(chunk_size2_start, chunk_size2_end):
-        b = create_benchmark(func, buffer_size2, chunk_size2)
-        b()
+def sample_upload(func, buffer_size2, chunk_size2, n):
+    """Get n timings (in ns) of an upload benchmark, after warming up."""
+    generator = func.__wrapped__(None, buffer_size2, chunk_size2)
+    generator.__next__()
+    warmup(generator)
+    times = []
+    for _ in range(n):
+        t0 = time.perf_counter_ns()
+        generator.__next__()
+        times.append(time.perf_counter_ns() - t0)
+    generator.close()
+    return times
+
+
+def find_tipping_point(
+    func, buffer_size2, min_chunk_size2, tolerance=0.1, alpha=0.01, n=10, max_n=80
+):
+    """Find the smallest (log2) chunk size for which uploading the whole
+    buffer in chunks is at most ``tolerance`` slower than a single upload.
+
+    The upload time decreases with the chunk size until it levels off, so
+    we bisect over the log2 chunk size. Each probe is compared with the
+    single upload using a Mann-Whitney U test; when the result is not
+    significant, the number of samples is doubled (up to max_n) before
+    deciding on the medians. This takes about log2(range) probes instead
+    of a full sweep, and spends samples only where the decision is close.
+    """
+    samples = {buffer_size2: sample_upload(func, buffer_size2, buffer_size2, n)}
+
+    def is_fast_enough(chunk_size2):
+        samples[chunk_size2] = sample_upload(func, buffer_size2, chunk_size2, n)
+        while True:
+            limit = np.array(samples[buffer_size2]) * (1 + tolerance)
+            ratio = np.median(samples[chunk_size2]) / np.median(limit)
+            _, p = mann_whitney_u(limit, samples[chunk_size2])
+            if p < alpha or len(samples[chunk_size2]) >= max_n:
+                return ratio <= 1
+            # Not conclusive yet, take more samples of both
+            k = len(samples[chunk_size2])
+            samples[chunk_size2] += sample_upload(func, buffer_size2, chunk_size2, k)
+            samples[buffer_size2] += sample_upload(func, buffer_size2, buffer_size2, k)
+
+    lo, hi = min_chunk_size2, buffer_size2
+    if is_fast_enough(lo):
+        return lo, samples
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if is_fast_enough(mid):
+            hi = mid
+        else:
+            lo = mid
+    return hi, samples
+
+
+def optimize(buffer_sizes2=(15, 20, 25, 28), tolerance=0.1):
+    """Find the recommended chunk size per buffer size and upload method.
+
+    The recommended chunk size is half the tipping point, because the worst
+    case for chunked uploads is when every other chunk must be uploaded
+    (adjacent chunks can be merged). See results/bm_wgpu_buffer_chunksize.md.
+    """
+    device = get_device()
+    result = {"adapter": device.adapter.summary, "tolerance": tolerance}
+    cost_points = []
+    for func in (up_wbuf_queue_write, up_wbuf_write_mapped):
+        table = result[func.__name__] = {}
+        for buffer_size2 in buffer_sizes2:
+            min_chunk_size2 = max(4, buffer_size2 - 14)
+            t0 = time.perf_counter()
+            tipping2, samples = find_tipping_point(
+                func, buffer_size2, min_chunk_size2, tolerance
+            )
+            chunk_size2 = max(min_chunk_size2, tipping2 - 1)
+            if func is up_wbuf_queue_write:
+                for probe2, times in samples.items():
+                    n_copies = 2 ** (buffer_size2 - probe2)
+                    cost_points.append((2**buffer_size2, n_copies, np.median(times)))
+            table[2**buffer_size2] = 2**chunk_size2
+            print(
+                f"{func.__name__} 2**{buffer_size2}: chunk size 2**{chunk_size2}"
+                + f" ({len(samples)} chunk sizes probed,"
+                + f" {sum(len(s) for s in samples.values())} samples,"
+                + f" {time.perf_counter() - t0:0.1f}s)",
+                file=sys.stderr,
+            )
+
+    # Bounds in the form of the arguments of pygfx' calculate_buffer_chunk_size()
+    # and calculate_texture_chunk_size(), based on the default (queue_write) method.
+    table = result["up_wbuf_queue_write"]
+    result["chunk_size_kwargs"] = {
+        "min_chunk_bytes": min(table.values()),
+        "max_chunk_bytes": max(table.values()),
+        "target_chunk_count": int(
+            np.median([size / chunk for size, chunk in table.items()])
+        ),
+    }
+
+    # The cost per copy and per byte, for coalescing ranges (see _coalesce.py)
+    result["cost_model"] = fit_cost_model(cost_points)
+    return result
 
 
 if __name__ == "__main__":
-    pass
-
-    # run_benchmarks(up_wbuf_queue_write, 15, 6, 16)
-    # run_benchmarks(up_wbuf_write_mapped, 15, 6, 16)
-
-    # run_benchmarks(up_wbuf_queue_write, 20, 10, 20)
-    # run_benchmarks(up_wbuf_write_mapped, 20, 10, 18)
-
-    # run_benchmarks(up_wbuf_queue_write, 25, 12, 22)
-    # run_benchmarks(up_wbuf_write_mapped, 25, 12, 22)
-
-    # run_benchmarks(up_wbuf_queue_write, 28, 14, 24)
-    # run_benchmarks(up_wbuf_write_mapped, 28, 14, 24)
-
-    # run_benchmarks(up_wbuf_queue_write, 30, 17, 30)
-    # run_benchmarks(up_wbuf_write_mapped, 30, 17, 30)
-
-    run_benchmarks(up_wbuf_queue_write, 31, 18, 31)
-    run_benchmarks(up_wbuf_write_mapped, 32, 19, 32)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--optimize", action="store_true", help="search chunk sizes")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[15, 20, 25, 28],
+        help="log2 buffer sizes to optimize for",
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.1, help="allowed slowdown from chunking"
+    )
+    parser.add_argument("--out", default=None, help="write the JSON table to a file")
+    parser.add_argument(
+        "--large", action="store_true", help="run the benchmarks for 1 GB+ buffers"
+    )
+    args = parser.parse_args()
+
+    if args.optimize:
+        result = optimize(args.sizes, args.tolerance)
+        text = json.dumps(result, indent=2)
+        print(text)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+    elif args.large:
+        max_size = get_device().limits["max-buffer-size"]
+        sizes = [(b, c) for b, c in LARGE_SIZES if 2**b <= max_size]
+        skipped = [b for b, _ in LARGE_SIZES if 2**b > max_size]
+        if skipped:
+            print(f"Skipping buffer sizes 2**{skipped} > max buffer size {max_size}")
+        run_all(
+            {
+                func.__name__: benchmark(20, params=get_grid(sizes))(func.__wrapped__)
+                for func in (up_wbuf_queue_write, up_wbuf_write_mapped)
+            }
+        )
+    else:
+        run_all(globals())
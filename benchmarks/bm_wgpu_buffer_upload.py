@@ -13,7 +13,9 @@ from pygfx.renderers.wgpu.engine.update import (
 )
 from pygfx.renderers.wgpu import get_shared
 
-from _benchmark import benchmark, run_all
+from _benchmark import benchmark, get_device, run_all
+from _fixtures import get_array
+from _staging import StagingPool, UploadPipeline, STAGING_USAGE
 
 
 def update_resource(resource):
@@ -21,9 +23,7 @@ def update_resource(resource):
     get_shared().device._poll()  # Wait for GPU to finish
 
 
-# Global device
-device = wgpu.gpu.request_adapter(power_preference="high-performance").request_device()
-print(device.adapter.summary)
+print(get_device().adapter.summary)
 
 N = 100_000_000
 nchunks = 1000
@@ -32,52 +32,12 @@ page_size = 4096
 aligned_split_size = (unaligned_split_size // page_size) * page_size
 
 
-def empty_aligned(shape, dtype=np.float64, align=4096):
-    """Get an array with desired memory alignment.
-
-    Parameters
-    ==========
-    shape: tuple of ints
-        The desired final shape of the array
-
-    dtype:
-        The desired dtype of the array
-
-    align:
-        The byte alignment of the array
-
-    Returns
-    =======
-    aligned_array:
-        Aligned array of desired shape.
-
-    """
-
-    if not isinstance(shape, tuple):
-        shape = (shape,)
-
-    dtype = np.dtype(dtype)
-    size = dtype.itemsize
-    # Compute the final size of the array
-    for s in shape:
-        size *= s
-
-    a = np.empty(size + (align - 1), dtype=np.uint8)
-    data_align = a.ctypes.data % align
-    offset = 0 if data_align == 0 else (align - data_align)
-    arr = a[offset : offset + size].view(dtype)
-    # Don't use reshape since reshape might copy the data.
-    # This is the suggested way to assign a new shape with guarantee
-    # That the data won't be copied.
-    arr.shape = shape
-    return arr
-
-
 ##
 
 
 @benchmark
 def make_some_assertions(canvas):
+    device = get_device()
 
     # This is to show that you cannot simply map a uniform/storage buffer.
     # An auxillary buffer is needed to move the data.
@@ -262,19 +222,101 @@ def up_wbuf_mapped_range_masked2(canvas):
     return upload_wgpu_buffer_get_mapped_range("masked2")
 
 
+# Async variants, that await the mapping and the GPU instead of blocking.
+# Compare the busy time with that of the blocking variants above.
+
+
+@benchmark(20)
+def up_wbuf_queue_write_async_set(canvas):
+    return upload_wgpu_buffer_queue_write_async("set")
+
+
+@benchmark(20)
+def up_wbuf_write_mapped_async_set(canvas):
+    return upload_wgpu_buffer_write_mapped_async("set")
+
+
+@benchmark(20)
+def up_wbuf_queue_write_async_add(canvas):
+    return upload_wgpu_buffer_queue_write_async("add")
+
+
+@benchmark(20)
+def up_wbuf_write_mapped_async_add(canvas):
+    return upload_wgpu_buffer_write_mapped_async("add")
+
+
+@benchmark(20)
+def up_wbuf_write_mapped_async_chunked(canvas):
+    return upload_wgpu_buffer_write_mapped_async("chunked")
+
+
+@benchmark(20)
+def up_wbuf_write_mapped_async_quarter3(canvas):
+    return upload_wgpu_buffer_write_mapped_async("quarter3")
+
+
+# Staging buffers from a pool vs a new staging buffer for each upload.
+
+staging_params = {"staging": ["per_upload", "pooled"]}
+
+
+@benchmark(20, params=staging_params)
+def up_wbuf_staging_set(canvas, staging):
+    return upload_wgpu_buffer_staging("set", staging)
+
+
+@benchmark(20, params=staging_params)
+def up_wbuf_staging_chunked(canvas, staging):
+    return upload_wgpu_buffer_staging("chunked", staging)
+
+
+@benchmark(20, params=staging_params)
+def up_wbuf_staging_quarter1(canvas, staging):
+    return upload_wgpu_buffer_staging("quarter1", staging)
+
+
+@benchmark(20, params=staging_params)
+def up_wbuf_staging_quarter3(canvas, staging):
+    return upload_wgpu_buffer_staging("quarter3", staging)
+
+
+@benchmark(20, params=staging_params)
+def up_wbuf_staging_add(canvas, staging):
+    return upload_wgpu_buffer_staging("add", staging)
+
+
+# Streaming uploads with k staging buffers in flight, so that filling a
+# buffer on the CPU overlaps with the copy of the previous one on the GPU.
+# The throughput (GB/s) says whether a stream of data can keep up.
+
+pipeline_params = {"k": [1, 2, 3, 4]}
+
+
+@benchmark(20, params=pipeline_params, nbytes=N)
+def up_wbuf_pipeline_set(canvas, k):
+    return upload_wgpu_buffer_pipeline("set", k)
+
+
+@benchmark(20, params=pipeline_params, nbytes=N)
+def up_wbuf_pipeline_add(canvas, k):
+    return upload_wgpu_buffer_pipeline("add", k)
+
+
 ##
 
 
 def upload_wgpu_buffer_queue_write(math):
+    device = get_device()
 
     # Upload via the convenience queue.write_buffer()
     # Simplest approach, but also the least flexible.
     # The abstraction allows optimizations under water though, so in certain use-cases it may be the fastest option.
 
-    data1 = np.ones((N,), np.uint8)
-    data2 = data1 + 1
-    data3 = np.ones((N * 2,), np.uint8)[::2]
-    data_aligned = empty_aligned(N, np.uint8)
+    data1 = get_array(N, np.uint8, 1)
+    data2 = get_array(N, np.uint8, 2)
+    data3 = get_array(N, np.uint8, 1, step=2)
+    data_aligned = get_array(N, np.uint8, 0, align=page_size)
 
     storage_buffer = device.create_buffer(
         size=N, usage=wgpu.BufferUsage.COPY_DST | wgpu.BufferUsage.STORAGE
@@ -320,13 +362,14 @@ def upload_wgpu_buffer_queue_write(math):
 
 
 def upload_wgpu_buffer_with_data(math):
+    device = get_device()
 
     # Upload by mapping and using device.create_buffer_with_data().
     # This avoids waiting for the buffer to be mapped, making it fast in theory.
 
-    data1 = np.ones((N,), np.uint8)
-    data2 = data1 + 1
-    data_aligned = empty_aligned(N, np.uint8)
+    data1 = get_array(N, np.uint8, 1)
+    data2 = get_array(N, np.uint8, 2)
+    data_aligned = get_array(N, np.uint8, 0, align=page_size)
 
     storage_buffer = device.create_buffer(
         size=N, usage=wgpu.BufferUsage.COPY_DST | wgpu.BufferUsage.STORAGE
@@ -381,14 +424,15 @@ def upload_wgpu_buffer_with_data(math):
 
 
 def upload_wgpu_buffer_write_mapped(math):
+    device = get_device()
 
     # Upload by mapping and using the safe write_mapped().
     # The call to buffer.map() waits for the queue. When we've gone async, this
     # approach might be faster (in terms of CPU cycles).
 
-    data1 = np.ones((N,), np.uint8)
-    data2 = data1 + 1
-    data_aligned = empty_aligned(N, np.uint8)
+    data1 = get_array(N, np.uint8, 1)
+    data2 = get_array(N, np.uint8, 2)
+    data_aligned = get_array(N, np.uint8, 0, align=page_size)
 
     storage_buffer = device.create_buffer(
         size=N, usage=wgpu.BufferUsage.COPY_DST | wgpu.BufferUsage.STORAGE
@@ -495,16 +539,17 @@ def upload_wgpu_buffer_write_mapped(math):
 
 
 def upload_wgpu_buffer_get_mapped_range(math):
+    device = get_device()
 
     # Upload by mapping and using the unsafe get_mapped_range().
     # The call to buffer.map() waits for the queue. When we've gone async, this
     # approach might be faster (in terms of CPU cycles).
 
-    data1 = np.ones((N,), np.uint8)
-    data2 = data1 + 1
-    data_aligned = empty_aligned(N, np.uint8)
+    data1 = get_array(N, np.uint8, 1)
+    data2 = get_array(N, np.uint8, 2)
+    data_aligned = get_array(N, np.uint8, 0, align=page_size)
 
-    data3 = np.ones((N * 2,), np.uint8)[::2]
+    data3 = get_array(N, np.uint8, 1, step=2)
     mask2 = np.zeros_like(data1, bool)
     mask2[::2] = True
 
@@ -581,5 +626,204 @@ def upload_wgpu_buffer_get_mapped_range(math):
         yield
 
 
+async def wait_for_queue():
+    """Wait for the GPU to finish the submitted work, without blocking if
+    this version of wgpu supports that. Otherwise falls back to _poll().
+    """
+    device = get_device()
+    queue = device.queue
+    if hasattr(queue, "on_submitted_work_done_async"):
+        await queue.on_submitted_work_done_async()
+        return
+    try:
+        await queue.on_submitted_work_done()
+    except (NotImplementedError, TypeError):
+        device._poll()
+
+
+async def upload_wgpu_buffer_queue_write_async(math):
+    device = get_device()
+
+    # Same as upload_wgpu_buffer_queue_write(), but awaits the GPU.
+
+    data1 = get_array(N, np.uint8, 1)
+    data2 = get_array(N, np.uint8, 2)
+
+    storage_buffer = device.create_buffer(
+        size=N, usage=wgpu.BufferUsage.COPY_DST | wgpu.BufferUsage.STORAGE
+    )
+
+    yield
+
+    while True:
+        if math == "set":
+            device.queue.write_buffer(storage_buffer, 0, data1, 0, N)
+        elif math == "add":
+            device.queue.write_buffer(storage_buffer, 0, data1 + data2, 0, N)
+        else:
+            assert False
+
+        device.queue.submit([])  # bit of a hack to prevent weird wgpu-core error
+        await wait_for_queue()
+
+        yield
+
+
+async def upload_wgpu_buffer_write_mapped_async(math):
+    device = get_device()
+
+    # Same as upload_wgpu_buffer_write_mapped(), but awaits the mapping and the GPU.
+
+    data1 = get_array(N, np.uint8, 1)
+    data2 = get_array(N, np.uint8, 2)
+
+    storage_buffer = device.create_buffer(
+        size=N, usage=wgpu.BufferUsage.COPY_DST | wgpu.BufferUsage.STORAGE
+    )
+
+    yield
+
+    while True:
+
+        encoder = device.create_command_encoder()
+
+        if math in ("set", "add", "chunked"):
+            tmp_buffer = device.create_buffer(
+                size=N, usage=wgpu.BufferUsage.MAP_WRITE | wgpu.BufferUsage.COPY_SRC
+            )
+            await tmp_buffer.map_async(wgpu.MapMode.WRITE)
+
+            if math == "set":
+                tmp_buffer.write_mapped(data1)
+            elif math == "add":
+                tmp_buffer.write_mapped(data1 + data2)
+            else:
+                n = unaligned_split_size
+                for i in range(nchunks):
+                    tmp_buffer.write_mapped(data1[i * n : (i + 1) * n], i * n)
+
+            tmp_buffer.unmap()
+            encoder.copy_buffer_to_buffer(tmp_buffer, 0, storage_buffer, 0, N)
+
+        elif math == "quarter3":
+            n = N // 4
+            tmp_buffer = device.create_buffer(
+                size=n, usage=wgpu.BufferUsage.MAP_WRITE | wgpu.BufferUsage.COPY_SRC
+            )
+            await tmp_buffer.map_async(wgpu.MapMode.WRITE)
+
+            tmp_buffer.write_mapped(data1[2 * n : 3 * n], 0)
+
+            tmp_buffer.unmap()
+            encoder.copy_buffer_to_buffer(tmp_buffer, 0, storage_buffer, 2 * n, n)
+
+        else:
+            assert False
+
+        device.queue.submit([encoder.finish()])
+        await wait_for_queue()
+
+        yield
+
+
+def upload_wgpu_buffer_staging(math, staging):
+    device = get_device()
+
+    # Upload with write_mapped(), like upload_wgpu_buffer_write_mapped(), but
+    # with the staging buffer either created for each upload, or taken from a
+    # pool, so that the cost of allocating staging buffers can be compared.
+
+    data1 = get_array(N, np.uint8, 1)
+    data2 = get_array(N, np.uint8, 2)
+
+    storage_buffer = device.create_buffer(
+        size=N, usage=wgpu.BufferUsage.COPY_DST | wgpu.BufferUsage.STORAGE
+    )
+    pool = StagingPool(device) if staging == "pooled" else None
+
+    def get_staging_buffer(size):
+        if pool is not None:
+            return pool.acquire(size)
+        tmp_buffer = device.create_buffer(size=size, usage=STAGING_USAGE)
+        tmp_buffer.map(wgpu.MapMode.WRITE)  # Waits for gpu with _poll()
+        return tmp_buffer
+
+    yield
+
+    while True:
+
+        encoder = device.create_command_encoder()
+
+        if math == "set":
+            offset, n = 0, N
+            tmp_buffer = get_staging_buffer(n)
+            tmp_buffer.write_mapped(data1, 0)
+        elif math == "add":
+            offset, n = 0, N
+            tmp_buffer = get_staging_buffer(n)
+            tmp_buffer.write_mapped(data1 + data2, 0)
+        elif math == "chunked":
+            offset, n = 0, N
+            tmp_buffer = get_staging_buffer(n)
+            m = unaligned_split_size
+            for i in range(nchunks):
+                tmp_buffer.write_mapped(data1[i * m : (i + 1) * m], i * m)
+        elif math == "quarter1":
+            offset, n = 0, N // 4
+            tmp_buffer = get_staging_buffer(n)
+            tmp_buffer.write_mapped(data1[:n], 0)
+        elif math == "quarter3":
+            offset, n = N // 2, N // 4
+            tmp_buffer = get_staging_buffer(n)
+            tmp_buffer.write_mapped(data1[offset : offset + n], 0)
+        else:
+            assert False
+
+        tmp_buffer.unmap()
+        encoder.copy_buffer_to_buffer(tmp_buffer, 0, storage_buffer, offset, n)
+
+        device.queue.submit([encoder.finish()])
+        device._poll()  # Wait for GPU to finish queue
+
+        if pool is not None:
+            pool.release(tmp_buffer)
+
+        yield
+
+
+async def upload_wgpu_buffer_pipeline(math, k):
+    device = get_device()
+
+    # Upload through an UploadPipeline with k staging buffers. Unlike the
+    # other benchmarks, this does not wait for the GPU at each iteration,
+    # so the time per iteration is the sustained time per upload.
+
+    data1 = get_array(N, np.uint8, 1)
+    data2 = get_array(N, np.uint8, 2)
+
+    storage_buffer = device.create_buffer(
+        size=N, usage=wgpu.BufferUsage.COPY_DST | wgpu.BufferUsage.STORAGE
+    )
+    pipeline = UploadPipeline(device, N, k)
+
+    def fill(buffer):
+        if math == "set":
+            buffer.write_mapped(data1, 0)
+        elif math == "add":
+            buffer.write_mapped(data1 + data2, 0)
+        else:
+            assert False
+
+    yield
+
+    try:
+        while True:
+            await pipeline.upload(fill, storage_buffer, 0, N)
+            yield
+    finally:
+        # The uploads still in flight count towards the throughput
+        await pipeline.flush()
+
+
 if __name__ == "__main__":
     run_all(globals())
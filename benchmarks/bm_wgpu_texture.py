@@ -18,7 +18,7 @@ from pygfx.renderers.wgpu.engine.update import (
 )
 from pygfx.renderers.wgpu import get_shared
 
-from _benchmark import benchmark, run_all
+from _benchmark import benchmark, get_device, run_all
 
 
 def update_resource(resource):
@@ -26,15 +26,68 @@ def update_resource(resource):
     get_shared().device._poll()  # Wait for GPU to finish
 
 
-# Global device
-device = wgpu.gpu.request_adapter(power_preference="high-performance").request_device()
-print(device.adapter.summary)
+print(get_device().adapter.summary)
 
 
 ##
 
 
-def up_wtex_write_mapped(dim, tex_size, chunk_size):
+def get_size(label):
+    """Get the texture (or chunk) size for a label like "512x512x256"."""
+    return tuple(int(x) for x in label.split("x"))
+
+
+def get_grid(dim, tex_size, chunk_sizes):
+    """Get (dim, tex_size, chunk_size) cases for a texture size and the
+    chunk sizes (as (x, y, z) tuples) to upload it in.
+    """
+    label = "x".join(str(x) for x in tex_size)
+    return [(dim, label, "x".join(str(x) for x in size)) for size in chunk_sizes]
+
+
+# Full uploads, to compare queue_write and write_mapped
+FULL_SIZES = [(256, 256, 1), (512, 512, 1), (1024, 1024, 1), (2048, 2048, 1)]
+full_params = {
+    ("dim", "tex_size", "chunk_size"): [
+        case for size in FULL_SIZES for case in get_grid(2, size, [size])
+    ]
+}
+
+# Uploads in chunks, varying the chunk size in all dimensions, or in one
+N2 = 8192
+SIZE3D = 512, 512, 256
+chunks_params = {
+    ("dim", "tex_size", "chunk_size"): [
+        *get_grid(1, (2048, 1, 1), [(2**i, 1, 1) for i in range(6, 12)]),
+        *get_grid(2, (N2, N2, 1), [(N2 // d, N2 // d, 1) for d in (32, 16, 8, 4, 2)]),
+        *get_grid(2, (N2, N2, 1), [(N2 // d, N2, 1) for d in (32, 16, 8, 4, 2)]),
+        *get_grid(2, (N2, N2, 1), [(N2, N2 // d, 1) for d in (32, 16, 8, 4, 2, 1)]),
+        *get_grid(2, SIZE3D, [(64, 64, 64), (128, 128, 128), (256, 256, 256), SIZE3D]),
+        *get_grid(2, SIZE3D, [(x, 512, 256) for x in (32, 64, 128, 256)]),
+        *get_grid(2, SIZE3D, [(512, y, 256) for y in (32, 64, 128, 256)]),
+        *get_grid(2, SIZE3D, [(512, 512, z) for z in (32, 64, 128, 256)]),
+    ]
+}
+
+# Uploads of one chunk at the origin, of different sizes
+one_chunk_params = {
+    ("dim", "tex_size", "chunk_size"): [
+        *get_grid(2, (8000, 8000, 1), [(8000, 8000, 1)]),
+        *get_grid(2, (8000, 8000, 1), [(x, 8000, 1) for x in (7000, 4000, 2000, 1000)]),
+        *get_grid(2, (8000, 8000, 1), [(8000, y, 1) for y in (7000, 4000, 2000, 1000)]),
+        *get_grid(3, (400, 400, 400), [(400, 400, 400)]),
+        *get_grid(3, (400, 400, 400), [(x, 400, 400) for x in (350, 200, 100, 50, 25)]),
+        *get_grid(3, (400, 400, 400), [(x, 200, 400) for x in (350, 200, 100, 50, 25)]),
+        *get_grid(3, (400, 400, 400), [(400, y, 400) for y in (350, 200, 100, 50)]),
+        *get_grid(3, (400, 400, 400), [(400, 400, z) for z in (350, 200, 100, 50)]),
+    ]
+}
+
+
+@benchmark(20, params=full_params)
+def up_wtex_write_mapped(canvas, dim, tex_size, chunk_size):
+    device = get_device()
+    tex_size, chunk_size = get_size(tex_size), get_size(chunk_size)
 
     assert isinstance(dim, int) and dim in (1, 2, 3)
     assert isinstance(tex_size, tuple) and len(tex_size) == 3
@@ -84,7 +137,18 @@ def up_wtex_write_mapped(dim, tex_size, chunk_size):
         yield
 
 
-def up_wtex_queue_write(dim, tex_size, chunk_size):
+@benchmark(20, params=full_params)
+def up_wtex_queue_write(canvas, dim, tex_size, chunk_size):
+    return upload_queue_write(dim, get_size(tex_size), get_size(chunk_size))
+
+
+@benchmark(20, params=chunks_params)
+def up_wtex_queue_write_chunks(canvas, dim, tex_size, chunk_size):
+    return upload_queue_write(dim, get_size(tex_size), get_size(chunk_size))
+
+
+def upload_queue_write(dim, tex_size, chunk_size):
+    device = get_device()
 
     assert isinstance(dim, int) and dim in (1, 2, 3)
     assert isinstance(tex_size, tuple) and len(tex_size) == 3
@@ -111,6 +175,8 @@ def up_wtex_queue_write(dim, tex_size, chunk_size):
             nchunks[i] = 1
             chunk_size[i] = tex_size[i]
 
+    yield
+
     while True:
 
         for iz in range(nchunks[2]):
@@ -143,8 +209,11 @@ def up_wtex_queue_write(dim, tex_size, chunk_size):
         yield
 
 
-def up_wtex_one_chunk(dim, tex_size, chunk_size):
+@benchmark(20, params=one_chunk_params)
+def up_wtex_one_chunk(canvas, dim, tex_size, chunk_size):
     """Measure opload time one of one particular chunk."""
+    device = get_device()
+    tex_size, chunk_size = get_size(tex_size), get_size(chunk_size)
     assert isinstance(dim, int) and dim in (1, 2, 3)
     assert isinstance(tex_size, tuple) and len(tex_size) == 3
 
@@ -163,6 +232,8 @@ def up_wtex_one_chunk(dim, tex_size, chunk_size):
 
     origin = (0, 0, 0)
 
+    yield
+
     while True:
         chunk = data1[
             origin[2] : origin[2] + chunk_size[2],
@@ -186,157 +257,5 @@ def up_wtex_one_chunk(dim, tex_size, chunk_size):
         yield
 
 
-def create_benchmark(func, dim, tex_size, chunk_size, suffix):
-
-    def wrapper():
-        return func(dim, tex_size, chunk_size)
-
-    wrapper.__name__ = func.__name__ + suffix
-    return benchmark(20)(wrapper)
-
-
-def run_benchmark_set(func, dim, tex_size):
-    b = create_benchmark(func, dim, tex_size, tex_size, f"_{tex_size}")
-    b()
-
-
-def run_benchmark_chunks(dim, tex_size, chunk_size):
-    func = up_wtex_queue_write
-    b = create_benchmark(func, dim, tex_size, chunk_size, f"_{tex_size}_{chunk_size}")
-    b()
-
-
-def run_benchmark_one_chunk(dim, tex_size, chunk_size):
-    func = up_wtex_one_chunk
-    b = create_benchmark(func, dim, tex_size, chunk_size, f"_{tex_size}_{chunk_size}")
-    b()
-
-
 if __name__ == "__main__":
-    pass
-
-    print("-- queue_write vs write_mapped")
-
-    run_benchmark_set(up_wtex_queue_write, 2, (256, 256, 1))
-    run_benchmark_set(up_wtex_queue_write, 2, (512, 512, 1))
-    run_benchmark_set(up_wtex_queue_write, 2, (1024, 1024, 1))
-    run_benchmark_set(up_wtex_queue_write, 2, (2048, 2048, 1))
-
-    run_benchmark_set(up_wtex_write_mapped, 2, (256, 256, 1))
-    run_benchmark_set(up_wtex_write_mapped, 2, (512, 512, 1))
-    run_benchmark_set(up_wtex_write_mapped, 2, (1024, 1024, 1))
-    run_benchmark_set(up_wtex_write_mapped, 2, (2048, 2048, 1))
-
-    print("-- 1D")
-
-    run_benchmark_chunks(1, (2048, 1, 1), (64, 1, 1))
-    run_benchmark_chunks(1, (2048, 1, 1), (128, 1, 1))
-    run_benchmark_chunks(1, (2048, 1, 1), (256, 1, 1))
-    run_benchmark_chunks(1, (2048, 1, 1), (512, 1, 1))
-    run_benchmark_chunks(1, (2048, 1, 1), (1024, 1, 1))
-    run_benchmark_chunks(1, (2048, 1, 1), (2048, 1, 1))
-
-    print("-- 2D")
-    N2 = 8192
-
-    run_benchmark_chunks(2, (N2, N2, 1), (N2 // 32, N2 // 32, 1))
-    run_benchmark_chunks(2, (N2, N2, 1), (N2 // 16, N2 // 16, 1))
-    run_benchmark_chunks(2, (N2, N2, 1), (N2 // 8, N2 // 8, 1))
-    run_benchmark_chunks(2, (N2, N2, 1), (N2 // 4, N2 // 4, 1))
-    run_benchmark_chunks(2, (N2, N2, 1), (N2 // 2, N2 // 2, 1))
-    run_benchmark_chunks(2, (N2, N2, 1), (N2 // 1, N2 // 1, 1))
-
-    print("--")
-
-    run_benchmark_chunks(2, (N2, N2, 1), (N2 // 32, N2, 1))
-    run_benchmark_chunks(2, (N2, N2, 1), (N2 // 16, N2, 1))
-    run_benchmark_chunks(2, (N2, N2, 1), (N2 // 8, N2, 1))
-    run_benchmark_chunks(2, (N2, N2, 1), (N2 // 4, N2, 1))
-    run_benchmark_chunks(2, (N2, N2, 1), (N2 // 2, N2, 1))
-    run_benchmark_chunks(2, (N2, N2, 1), (N2 // 1, N2, 1))
-
-    print("--")
-
-    run_benchmark_chunks(2, (N2, N2, 1), (N2, N2 // 32, 1))
-    run_benchmark_chunks(2, (N2, N2, 1), (N2, N2 // 16, 1))
-    run_benchmark_chunks(2, (N2, N2, 1), (N2, N2 // 8, 1))
-    run_benchmark_chunks(2, (N2, N2, 1), (N2, N2 // 4, 1))
-    run_benchmark_chunks(2, (N2, N2, 1), (N2, N2 // 2, 1))
-    run_benchmark_chunks(2, (N2, N2, 1), (N2, N2 // 1, 1))
-
-    print("-- 3D")
-    size3d = 512, 512, 256
-    dim = 2
-
-    run_benchmark_chunks(dim, size3d, (64, 64, 64))
-    run_benchmark_chunks(dim, size3d, (128, 128, 128))
-    run_benchmark_chunks(dim, size3d, (256, 256, 256))
-    run_benchmark_chunks(dim, size3d, (512, 512, 256))
-
-    print("--")
-
-    run_benchmark_chunks(dim, size3d, (32, 512, 256))
-    run_benchmark_chunks(dim, size3d, (64, 512, 256))
-    run_benchmark_chunks(dim, size3d, (128, 512, 256))
-    run_benchmark_chunks(dim, size3d, (256, 512, 256))
-    run_benchmark_chunks(dim, size3d, (512, 512, 256))
-
-    print("--")
-
-    run_benchmark_chunks(dim, size3d, (512, 32, 256))
-    run_benchmark_chunks(dim, size3d, (512, 64, 256))
-    run_benchmark_chunks(dim, size3d, (512, 128, 256))
-    run_benchmark_chunks(dim, size3d, (512, 256, 256))
-    run_benchmark_chunks(dim, size3d, (512, 512, 256))
-
-    print("--")
-
-    run_benchmark_chunks(dim, size3d, (512, 512, 32))
-    run_benchmark_chunks(dim, size3d, (512, 512, 64))
-    run_benchmark_chunks(dim, size3d, (512, 512, 128))
-    run_benchmark_chunks(dim, size3d, (512, 512, 256))
-    # run_benchmark_chunks(dim, size3d, (512, 512, 256))
-
-    print("-- 2D one chunk")
-
-    run_benchmark_one_chunk(2, (8000, 8000, 1), (8000, 8000, 1))
-
-    run_benchmark_one_chunk(2, (8000, 8000, 1), (7000, 8000, 1))
-    run_benchmark_one_chunk(2, (8000, 8000, 1), (4000, 8000, 1))
-    run_benchmark_one_chunk(2, (8000, 8000, 1), (2000, 8000, 1))
-    run_benchmark_one_chunk(2, (8000, 8000, 1), (1000, 8000, 1))
-
-    run_benchmark_one_chunk(2, (8000, 8000, 1), (8000, 7000, 1))
-    run_benchmark_one_chunk(2, (8000, 8000, 1), (8000, 4000, 1))
-    run_benchmark_one_chunk(2, (8000, 8000, 1), (8000, 2000, 1))
-    run_benchmark_one_chunk(2, (8000, 8000, 1), (8000, 1000, 1))
-
-    print("-- 3D one chunk")
-
-    run_benchmark_one_chunk(3, (400, 400, 400), (400, 400, 400))
-
-    print("--")
-    run_benchmark_one_chunk(3, (400, 400, 400), (350, 400, 400))
-    run_benchmark_one_chunk(3, (400, 400, 400), (200, 400, 400))
-    run_benchmark_one_chunk(3, (400, 400, 400), (100, 400, 400))
-    run_benchmark_one_chunk(3, (400, 400, 400), (50, 400, 400))
-    run_benchmark_one_chunk(3, (400, 400, 400), (25, 400, 400))
-
-    print("--")
-    run_benchmark_one_chunk(3, (400, 400, 400), (350, 200, 400))
-    run_benchmark_one_chunk(3, (400, 400, 400), (200, 200, 400))
-    run_benchmark_one_chunk(3, (400, 400, 400), (100, 200, 400))
-    run_benchmark_one_chunk(3, (400, 400, 400), (50, 200, 400))
-    run_benchmark_one_chunk(3, (400, 400, 400), (25, 200, 400))
-
-    print("--")
-    run_benchmark_one_chunk(3, (400, 400, 400), (400, 350, 400))
-    run_benchmark_one_chunk(3, (400, 400, 400), (400, 200, 400))
-    run_benchmark_one_chunk(3, (400, 400, 400), (400, 100, 400))
-    run_benchmark_one_chunk(3, (400, 400, 400), (400, 50, 400))
-
-    print("--")
-    run_benchmark_one_chunk(3, (400, 400, 400), (400, 400, 350))
-    run_benchmark_one_chunk(3, (400, 400, 400), (400, 400, 200))
-    run_benchmark_one_chunk(3, (400, 400, 400), (400, 400, 100))
-    run_benchmark_one_chunk(3, (400, 400, 400), (400, 400, 50))
+    run_all(globals())
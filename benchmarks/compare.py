@@ -0,0 +1,161 @@
+"""
+Compare the results of two benchmark runs.
+
+Benchmarks are matched by name and parameters. For each time key that
+both runs have, the raw samples are compared with a Mann-Whitney U test,
+so that real changes can be told apart from jitter.
+
+Usage:
+
+    python compare.py BASELINE CANDIDATE [--key cpu] [--alpha 0.01] [--threshold 0.05] [--json]
+
+BASELINE and CANDIDATE can be a run id (or a prefix), "latest", "previous",
+or the path of a JSON Lines file. The exit code is 1 if a regression was found,
+so this can be used as a gate in CI.
+
+To compare profiles (see ``run.py --profile``), pass two .pstats files or
+two profile directories, and use the --profiles flag:
+
+    python compare.py --profiles PROFILE_DIR1 PROFILE_DIR2
+"""
+
+import os
+import sys
+import json
+import argparse
+
+import numpy as np
+
+from _stats import mann_whitney_u
+from _store import load_run, record_key
+from _profile import compare_profiles
+
+
+def compare_records(
+    baseline_records, candidate_records, keys=None, alpha=0.01, threshold=0.05
+):
+    """Compare two lists of records. Returns a list of dicts, one per
+    benchmark and time key.
+
+    A change is considered significant when the p-value is below alpha
+    and the medians differ more than the given fraction (threshold).
+    """
+    # If a benchmark is present multiple times, the last one wins
+    baseline = {record_key(r): r for r in baseline_records}
+    candidate = {record_key(r): r for r in candidate_records}
+
+    comparisons = []
+    for key, cand_record in candidate.items():
+        base_record = baseline.get(key)
+        if base_record is None:
+            continue
+        base_samples = base_record["samples_ns"]
+        cand_samples = cand_record["samples_ns"]
+        for time_key in cand_samples:
+            if keys and time_key not in keys:
+                continue
+            if time_key not in base_samples:
+                continue
+            s1 = np.asarray(base_samples[time_key], np.float64) / 1_000_000
+            s2 = np.asarray(cand_samples[time_key], np.float64) / 1_000_000
+            if len(s1) == 0 or len(s2) == 0:
+                continue
+            median1 = float(np.median(s1))
+            median2 = float(np.median(s2))
+            ratio = median2 / median1 if median1 > 0 else np.nan
+            _, p = mann_whitney_u(s1, s2)
+            if p < alpha and ratio > 1 + threshold:
+                status = "slower"
+            elif p < alpha and ratio < 1 - threshold:
+                status = "faster"
+            else:
+                status = "same"
+            comparisons.append(
+                {
+                    "name": cand_record["name"],
+                    "module": cand_record.get("module"),
+                    "params": cand_record.get("params", {}),
+                    "key": time_key,
+                    "baseline_ms": median1,
+                    "candidate_ms": median2,
+                    "ratio": ratio,
+                    "p": p,
+                    "status": status,
+                }
+            )
+    return comparisons
+
+
+def print_comparisons(comparisons):
+    symbols = {"slower": "!!", "faster": "++", "same": "  "}
+    for c in comparisons:
+        name = c["name"]
+        if c["key"] != "cpu":
+            name += f" ({c['key']})"
+        print(
+            f"{symbols[c['status']]} {name.rjust(40)}"
+            + f"  {c['baseline_ms']:0.2f} -> {c['candidate_ms']:0.2f} ms"
+            + f"  x{c['ratio']:0.2f}  p={c['p']:0.3g}  {c['status']}"
+        )
+    n_slower = sum(c["status"] == "slower" for c in comparisons)
+    n_faster = sum(c["status"] == "faster" for c in comparisons)
+    print(f"\n{len(comparisons)} compared, {n_slower} slower, {n_faster} faster")
+
+
+def print_profile_comparisons(path1, path2):
+    if os.path.isdir(path1) and os.path.isdir(path2):
+        fnames = sorted(f for f in os.listdir(path2) if f.endswith(".pstats"))
+        pairs = [
+            (os.path.join(path1, f), os.path.join(path2, f))
+            for f in fnames
+            if os.path.isfile(os.path.join(path1, f))
+        ]
+    else:
+        pairs = [(path1, path2)]
+    for filename1, filename2 in pairs:
+        print(f"\n{os.path.basename(filename2)}\n")
+        print(compare_profiles(filename1, filename2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark runs.")
+    parser.add_argument(
+        "baseline", help="run id, 'latest', 'previous', or a .jsonl file"
+    )
+    parser.add_argument(
+        "candidate", help="run id, 'latest', 'previous', or a .jsonl file"
+    )
+    parser.add_argument("--store", default=None, help="the store to load runs from")
+    parser.add_argument(
+        "--key", action="append", help="time key(s) to compare (default all)"
+    )
+    parser.add_argument("--alpha", type=float, default=0.01, help="significance level")
+    parser.add_argument(
+        "--threshold", type=float, default=0.05, help="min relative change to report"
+    )
+    parser.add_argument("--json", action="store_true", help="emit JSON instead of text")
+    parser.add_argument(
+        "--profiles", action="store_true", help="compare .pstats files or directories"
+    )
+    args = parser.parse_args(argv)
+
+    if args.profiles:
+        print_profile_comparisons(args.baseline, args.candidate)
+        return 0
+
+    baseline_records = load_run(args.baseline, args.store)
+    candidate_records = load_run(args.candidate, args.store)
+    comparisons = compare_records(
+        baseline_records, candidate_records, args.key, args.alpha, args.threshold
+    )
+
+    if args.json:
+        print(json.dumps(comparisons, indent=2))
+    else:
+        print_comparisons(comparisons)
+
+    return 1 if any(c["status"] == "slower" for c in comparisons) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+"""
+Generate a self-contained HTML dashboard from the result store.
+
+The dashboard shows, for each benchmark, the median time over the runs in
+the store as a time series, with one line per adapter (see report.py). Runs
+that are significantly slower or faster than the previous run on the same
+adapter (as determined by compare.py) are marked in red or green. Hovering
+a point shows the run and versions, and clicking it opens the benchmark source.
+
+At the top is a summary of the benchmarks that drifted the most over the
+shown period, so that it is easy to see what needs attention.
+
+Usage:
+
+    python dashboard.py [--store PATH] [--days 30] [--key cpu] [-o dashboard.html]
+"""
+
+import os
+import sys
+import ast
+import html
+import argparse
+import datetime
+
+from _store import REPO_DIR, load_records
+from compare import compare_records
+from report import group_records
+
+BENCHMARKS_DIR = os.path.join(REPO_DIR, "benchmarks")
+DEFAULT_OUTPUT = os.path.join(REPO_DIR, ".results", "dashboard.html")
+
+COLORS = ["#1f77b4", "#ff7f0e", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f"]
+STATUS_COLORS = {"slower": "#d62728", "faster": "#2ca02c"}
+
+WIDTH, HEIGHT, MARGIN = 640, 160, 40
+
+CSS = """
+body { font-family: sans-serif; margin: 2em; color: #222; }
+table { border-collapse: collapse; margin-bottom: 2em; }
+td, th { padding: 2px 10px; text-align: left; border-bottom: 1px solid #ddd; }
+.slower { color: #d62728; } .faster { color: #2ca02c; }
+.benchmark { margin-bottom: 2em; }
+.legend span { margin-right: 1em; }
+svg { background: #fafafa; border: 1px solid #ddd; }
+"""
+
+_function_lines = {}
+
+
+def get_source_link(record, output_dir):
+    """Get a link to the source of the benchmark of a record, relative to
+    the output directory, with the line number of the function.
+    """
+    module = record.get("module") or ""
+    filename = os.path.join(BENCHMARKS_DIR, module + ".py")
+    if filename not in _function_lines:
+        try:
+            with open(filename, encoding="utf-8") as f:
+                tree = ast.parse(f.read())
+        except (OSError, SyntaxError):
+            tree = None
+        _function_lines[filename] = {
+            node.name: node.lineno
+            for node in (tree.body if tree else [])
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+        }
+    lines = _function_lines[filename]
+    name = record.get("benchmark") or record["name"].split("/")[0]
+    lineno = lines.get(name) or lines.get("benchmark_" + name)
+    link = os.path.relpath(filename, output_dir).replace("\\", "/")
+    return link + (f"#L{lineno}" if lineno else "")
+
+
+def parse_time(record):
+    return datetime.datetime.fromisoformat(record["timestamp"])
+
+
+def annotate(records, key):
+    """Get a list of (record, comparison) for a series of records, where
+    comparison is the comparison with the previous record, or None.
+    """
+    result = [(records[0], None)]
+    for prev, record in zip(records[:-1], records[1:]):
+        comparisons = compare_records([prev], [record], [key])
+        result.append((record, comparisons[0] if comparisons else None))
+    return result
+
+
+def render_chart(series, columns, key, t_min, t_max, output_dir):
+    """Render an SVG chart with one line per column."""
+    medians = [
+        r["stats_ms"][key]["median"] for records in series.values() for r in records
+    ]
+    y_max = max(medians) * 1.1 or 1.0
+    t_range = max((t_max - t_min).total_seconds(), 1.0)
+
+    def xy(record):
+        x = MARGIN + (WIDTH - 2 * MARGIN) * (
+            (parse_time(record) - t_min).total_seconds() / t_range
+        )
+        y = (
+            HEIGHT
+            - MARGIN / 2
+            - (HEIGHT - MARGIN) * (record["stats_ms"][key]["median"] / y_max)
+        )
+        return x, y
+
+    parts = [
+        f'<svg width="{WIDTH}" height="{HEIGHT}" xmlns="http://www.w3.org/2000/svg">',
+        f'<text x="4" y="12" font-size="10">{y_max:0.2f} ms</text>',
+        f'<text x="4" y="{HEIGHT - 4}" font-size="10">0</text>',
+    ]
+    for i, column in enumerate(columns):
+        records = series.get(column)
+        if not records:
+            continue
+        color = COLORS[i % len(COLORS)]
+        points = " ".join(f"{x:0.1f},{y:0.1f}" for x, y in map(xy, records))
+        parts.append(
+            f'<polyline points="{points}" fill="none" stroke="{color}" stroke-width="1.5"/>'
+        )
+        for record, comparison in annotate(records, key):
+            x, y = xy(record)
+            status = comparison["status"] if comparison else "same"
+            fill = STATUS_COLORS.get(status, color)
+            radius = 5 if status in STATUS_COLORS else 3
+            stats = record["stats_ms"][key]
+            meta = record.get("meta", {})
+            title = (
+                f"{column}\nrun {record['run_id']}\n"
+                + f"median {stats['median']:0.3f} ms"
+                + f" [{stats['ci_low']:0.3f}, {stats['ci_high']:0.3f}]\n"
+                + f"pygfx {meta.get('pygfx')} {meta.get('pygfx_sha') or ''}\n"
+                + f"wgpu {meta.get('wgpu')}"
+            )
+            if comparison:
+                title += (
+                    f"\n{status} x{comparison['ratio']:0.2f} p={comparison['p']:0.2g}"
+                )
+            link = get_source_link(record, output_dir)
+            parts.append(
+                f'<a href="{html.escape(link)}"><circle cx="{x:0.1f}" cy="{y:0.1f}"'
+                + f' r="{radius}" fill="{fill}"><title>{html.escape(title)}</title>'
+                + "</circle></a>"
+            )
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+def get_drift(records, key):
+    """Get the relative change of the median over a series of records."""
+    first = records[0]["stats_ms"][key]["median"]
+    last = records[-1]["stats_ms"][key]["median"]
+    return last / first - 1 if first > 0 else 0.0
+
+
+def generate_dashboard(records, key="cpu", output_dir="."):
+    """Generate the HTML for the given records."""
+    records = [r for r in records if key in r.get("stats_ms", {})]
+    if records:
+        t_min = min(parse_time(r) for r in records)
+        t_max = max(parse_time(r) for r in records)
+
+    # Group per module, then per benchmark and column
+    modules = {}
+    for record in records:
+        modules.setdefault(record.get("module") or "", []).append(record)
+
+    summary = []
+    sections = []
+    for module_name in sorted(modules):
+        columns, names, series = group_records(modules[module_name], key)
+        legend = " ".join(
+            f'<span style="color:{COLORS[i % len(COLORS)]}">&#9632; {html.escape(c)}</span>'
+            for i, c in enumerate(columns)
+        )
+        sections.append(f"<h2>{html.escape(module_name)}</h2>")
+        sections.append(f'<div class="legend">{legend}</div>')
+        for name in names:
+            name_series = {c: series[(c, name)] for c in columns if (c, name) in series}
+            anchor = html.escape(f"{module_name}-{name}")
+            sections.append(f'<div class="benchmark" id="{anchor}">')
+            sections.append(f"<h3>{html.escape(name)}</h3>")
+            sections.append(
+                render_chart(name_series, columns, key, t_min, t_max, output_dir)
+            )
+            sections.append("</div>")
+            for column, column_records in name_series.items():
+                n_slower = sum(
+                    c is not None and c["status"] == "slower"
+                    for _, c in annotate(column_records, key)
+                )
+                summary.append(
+                    (
+                        get_drift(column_records, key),
+                        n_slower,
+                        anchor,
+                        name,
+                        column,
+                        column_records[-1]["stats_ms"][key]["median"],
+                    )
+                )
+
+    # Summary table, the largest drifts first
+    summary.sort(key=lambda s: -abs(s[0]))
+    rows = []
+    for drift, n_slower, anchor, name, column, median in summary:
+        cls = "slower" if drift > 0.05 else "faster" if drift < -0.05 else ""
+        rows.append(
+            f'<tr><td><a href="#{anchor}">{html.escape(name)}</a></td>'
+            + f"<td>{html.escape(column)}</td><td>{median:0.2f} ms</td>"
+            + f'<td class="{cls}">{100 * drift:+0.1f}%</td><td>{n_slower}</td></tr>'
+        )
+
+    generated = datetime.datetime.now().isoformat(timespec="seconds")
+    return "\n".join(
+        [
+            "<!DOCTYPE html>",
+            '<html><head><meta charset="utf-8"><title>pygfx benchmarks</title>',
+            f"<style>{CSS}</style></head><body>",
+            "<h1>pygfx benchmarks</h1>",
+            f"<p>{len(records)} results, median <code>{key}</code> time."
+            + f" Generated {generated}.</p>",
+            "<table><tr><th>benchmark</th><th>adapter</th><th>latest</th>"
+            + "<th>drift</th><th>regressions</th></tr>",
+            *rows,
+            "</table>",
+            *sections,
+            "</body></html>",
+        ]
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate an HTML dashboard.")
+    parser.add_argument("--store", default=None, help="the store to load runs from")
+    parser.add_argument("--key", default="cpu", help="the time key to show")
+    parser.add_argument(
+        "--days", type=float, default=30, help="show the results of the last N days"
+    )
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT, help="the HTML file")
+    args = parser.parse_args(argv)
+
+    since = datetime.datetime.now() - datetime.timedelta(days=args.days)
+    records = load_records(
+        args.store, timestamp=lambda t: parse_time({"timestamp": t}) >= since
+    )
+
+    output = os.path.abspath(args.output)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    text = generate_dashboard(records, args.key, os.path.dirname(output))
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(text)
+    print(f"Wrote {output} ({len(records)} results)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""
+Generate the result tables in ``results/*.md`` from the result store.
+
+For each benchmark module, a table is generated with one row per
+benchmark, and one column per machine (adapter). Each cell shows the
+median time of the latest run on that machine, the change relative to
+the previous run (marked with "!!" or "++" when significant, like
+compare.py does), and a sparkline of the medians of recent runs.
+
+The table is written between the markers below. If a results file does
+not have these markers, a "Latest results" section is appended. Text
+outside the markers is left alone, so the generated section can be moved
+to wherever it fits the document.
+
+    <!-- begin generated -->
+    <!-- end generated -->
+
+Usage:
+
+    python report.py [MODULE ...] [--store PATH] [--key cpu] [--runs 20] [--check]
+
+With --check, no files are written, and the exit code is 1 if any file
+is out of date.
+"""
+
+import os
+import sys
+import argparse
+
+from _store import REPO_DIR, load_records
+from compare import compare_records
+
+RESULTS_DIR = os.path.join(REPO_DIR, "results")
+
+BEGIN_MARKER = "<!-- begin generated -->"
+END_MARKER = "<!-- end generated -->"
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+
+def sparkline(values):
+    """Get a string of block characters representing the values."""
+    values = [v for v in values if v is not None]
+    if not values:
+        return ""
+    vmin, vmax = min(values), max(values)
+    if vmax - vmin <= 1e-9 * vmax:
+        return SPARK_CHARS[len(SPARK_CHARS) // 2] * len(values)
+    n = len(SPARK_CHARS) - 1
+    return "".join(SPARK_CHARS[round(n * (v - vmin) / (vmax - vmin))] for v in values)
+
+
+def get_column_label(meta):
+    # Only the first line, and no pipes, so that it fits in a table header
+    label = (meta.get("adapter") or "unknown adapter").strip().splitlines()[0]
+    return label.replace("|", "/")
+
+
+def group_records(records, key="cpu"):
+    """Group the records of one module by column and benchmark name.
+
+    Returns (columns, names, series), where columns is a list of column
+    labels, names is a list of benchmark names, and series maps
+    (column, name) to a list of records, oldest first.
+    """
+    # A column per adapter. If the same adapter is found on multiple
+    # hosts (e.g. lavapipe), the hostname is added to tell them apart.
+    hosts_per_adapter = {}
+    for record in records:
+        meta = record.get("meta", {})
+        hosts = hosts_per_adapter.setdefault(get_column_label(meta), set())
+        hosts.add(meta.get("hostname"))
+
+    columns, names, series = [], [], {}
+    for record in sorted(records, key=lambda r: r["run_id"]):
+        if key not in record.get("stats_ms", {}):
+            continue
+        meta = record.get("meta", {})
+        column = get_column_label(meta)
+        if len(hosts_per_adapter[column]) > 1:
+            column += f" ({meta.get('hostname')})"
+        if column not in columns:
+            columns.append(column)
+        if record["name"] not in names:
+            names.append(record["name"])
+        series.setdefault((column, record["name"]), []).append(record)
+    return columns, names, series
+
+
+def format_cell(records, key="cpu", n_runs=20):
+    """Format a table cell for the records of one benchmark on one machine."""
+    if not records:
+        return ""
+    latest = records[-1]
+    text = f"{latest['stats_ms'][key]['median']:0.2f} ms"
+    if len(records) > 1:
+        comparisons = compare_records([records[-2]], [latest], [key])
+        if comparisons:
+            c = comparisons[0]
+            symbol = {"slower": " !!", "faster": " ++"}.get(c["status"], "")
+            text += f" ({100 * (c['ratio'] - 1):+0.0f}%{symbol})"
+        medians = [r["stats_ms"][key]["median"] for r in records[-n_runs:]]
+        text += " " + sparkline(medians)
+    return text
+
+
+def generate_table(records, key="cpu", n_runs=20):
+    """Generate the markdown for the results of one module."""
+    columns, names, series = group_records(records, key)
+    if not names:
+        return "No results in the store yet.\n"
+
+    lines = [
+        f"Median `{key}` time of the latest run, the change relative to the"
+        + " previous run, and the trend over recent runs.",
+        "",
+        "| benchmark | " + " | ".join(columns) + " |",
+        "|---" * (len(columns) + 1) + "|",
+    ]
+    for name in names:
+        cells = [format_cell(series.get((c, name), []), key, n_runs) for c in columns]
+        lines.append(f"| {name} | " + " | ".join(cells) + " |")
+
+    # A legend with the software versions of the latest run per column
+    lines.append("")
+    for column in columns:
+        latest = max(
+            (recs[-1] for (c, _), recs in series.items() if c == column),
+            key=lambda r: r["run_id"],
+        )
+        meta = latest.get("meta", {})
+        lines.append(
+            f"* {column}: run {latest['run_id']}, pygfx {meta.get('pygfx')},"
+            + f" wgpu {meta.get('wgpu')}, {meta.get('cpu')}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def update_text(text, generated):
+    """Put the generated text between the markers in the given text."""
+    block = f"{BEGIN_MARKER}\n{generated}{END_MARKER}"
+    if BEGIN_MARKER in text and END_MARKER in text:
+        before = text.split(BEGIN_MARKER, 1)[0]
+        after = text.split(END_MARKER, 1)[1]
+        return before + block + after
+    return text.rstrip() + "\n\n\n## Latest results\n\n" + block + "\n"
+
+
+def update_results_file(module_name, records, key="cpu", n_runs=20, check=False):
+    """Update the results file of a module. Returns whether it changed."""
+    filename = os.path.join(RESULTS_DIR, module_name + ".md")
+    if os.path.isfile(filename):
+        with open(filename, encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = (
+            f"# {module_name}\n\n[{module_name}.py](../benchmarks/{module_name}.py)\n"
+        )
+    new_text = update_text(text, generate_table(records, key, n_runs))
+    if new_text == text:
+        return False
+    if not check:
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write(new_text)
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Update results/*.md from the store.")
+    parser.add_argument(
+        "modules", nargs="*", help="benchmark modules to report (default all)"
+    )
+    parser.add_argument("--store", default=None, help="the store to load runs from")
+    parser.add_argument("--key", default="cpu", help="the time key to report")
+    parser.add_argument(
+        "--runs", type=int, default=20, help="number of runs in the sparklines"
+    )
+    parser.add_argument(
+        "--check", action="store_true", help="don't write, exit 1 if out of date"
+    )
+    args = parser.parse_args(argv)
+
+    records_per_module = {}
+    for record in load_records(args.store):
+        records_per_module.setdefault(record.get("module"), []).append(record)
+
+    module_names = [os.path.splitext(os.path.basename(m))[0] for m in args.modules]
+    module_names = module_names or sorted(m for m in records_per_module if m)
+
+    n_changed = 0
+    for module_name in module_names:
+        records = records_per_module.get(module_name, [])
+        if update_results_file(module_name, records, args.key, args.runs, args.check):
+            n_changed += 1
+            verb = "Out of date" if args.check else "Updated"
+            print(f"{verb}: results/{module_name}.md")
+
+    if args.check and n_changed:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,464 @@
+"""
+Run benchmarks from all (or selected) benchmark modules.
+
+Benchmark modules are the ``bm_*.py`` files in this directory. By default,
+each benchmark runs in a fresh subprocess, so that e.g. memory that is
+held on to by one benchmark cannot affect the next. The subprocesses
+stream their results back, and the results are stored in the result store.
+
+Usage:
+
+    python run.py [MODULE ...] [-k GLOB] [--tag TAG] [--isolate MODE] [--list]
+                  [--budget SECONDS]
+
+Examples:
+
+    python run.py bm_buffer -k "upload_buffer_random*"
+    python run.py --tag texture --isolate module
+    python run.py --budget 600
+"""
+
+import os
+import sys
+import json
+import fnmatch
+import argparse
+import threading
+import traceback
+import importlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def discover_modules():
+    """Get the names of all benchmark modules."""
+    names = []
+    for fname in sorted(os.listdir(BENCHMARKS_DIR)):
+        if fname.startswith("bm_") and fname.endswith(".py"):
+            names.append(fname[:-3])
+    return names
+
+
+def import_module(module_name):
+    if BENCHMARKS_DIR not in sys.path:
+        sys.path.insert(0, BENCHMARKS_DIR)
+    return importlib.import_module(module_name)
+
+
+def get_benchmark_infos(module_name, funcs):
+    """Get a list of dicts describing the benchmark cases of the given functions."""
+    from _benchmark import get_pygfx_files
+
+    infos = []
+    for func in funcs:
+        pygfx_files = get_pygfx_files(func.__wrapped__)
+        for case_id, case in func.cases:
+            infos.append(
+                {
+                    "module": module_name,
+                    "name": case_id,
+                    "tags": sorted(func.tags),
+                    "kind": func.kind,
+                    "pygfx_files": pygfx_files,
+                }
+            )
+    return infos
+
+
+def run_module_benchmarks(module_name, names, canvas):
+    """Run the benchmark cases with the given names in a module. A case
+    that raises is reported, and the others are still run. Returns the
+    number of cases that failed.
+    """
+    from _benchmark import collect_benchmarks
+
+    n_failed = 0
+    module = import_module(module_name)
+    for func in collect_benchmarks(vars(module)):
+        for case_id, case in func.cases:
+            if case_id in names:
+                try:
+                    func(canvas, **case)
+                except Exception:
+                    traceback.print_exc()
+                    print(f"Benchmark {case_id} failed")
+                    n_failed += 1
+    return n_failed
+
+
+def select_benchmarks(infos, patterns=None, tags=None):
+    """Select benchmarks (dicts with name and tags) by name glob and tag."""
+    selected = []
+    for info in infos:
+        if patterns and not any(fnmatch.fnmatch(info["name"], p) for p in patterns):
+            continue
+        if tags and not set(tags).intersection(info["tags"]):
+            continue
+        selected.append(info)
+    return selected
+
+
+# %% Child process
+
+
+def child_list(module_name):
+    """Print the benchmarks in a module as JSON."""
+    from _benchmark import collect_benchmarks, RECORD_PREFIX
+
+    module = import_module(module_name)
+    infos = get_benchmark_infos(module_name, collect_benchmarks(vars(module)))
+    print(RECORD_PREFIX + json.dumps(infos), flush=True)
+
+
+def child_run(module_name, names, cpu=None):
+    """Run the benchmarks with the given names in a module. Returns the
+    number of failures.
+    """
+    from _benchmark import OffscreenWgpuCanvas
+    from _environment import pin_to_cpu
+
+    if cpu is not None:
+        pin_to_cpu(cpu)
+
+    canvas = OffscreenWgpuCanvas()
+    return run_module_benchmarks(module_name, names, canvas)
+
+
+# %% Parent process
+
+
+_print_lock = threading.Lock()
+
+
+def run_child(args, on_record=None, buffer_output=False):
+    """Run a child process, passing through its output and collecting
+    the records that it streams. Returns (records, returncode).
+
+    If buffer_output is True, the output is printed when the child is
+    done, so that the output of parallel children does not interleave.
+    """
+    from _benchmark import RECORD_PREFIX
+
+    cmd = [sys.executable, "-u", os.path.abspath(__file__)] + args
+    p = subprocess.Popen(
+        cmd, cwd=BENCHMARKS_DIR, stdout=subprocess.PIPE, text=True, bufsize=1
+    )
+    records = []
+    lines = []
+    for line in p.stdout:
+        if line.startswith(RECORD_PREFIX):
+            record = json.loads(line[len(RECORD_PREFIX) :])
+            records.append(record)
+            if on_record:
+                on_record(record)
+        elif buffer_output:
+            lines.append(line)
+        else:
+            sys.stdout.write(line)
+            sys.stdout.flush()
+    returncode = p.wait()
+    if lines:
+        with _print_lock:
+            sys.stdout.write("".join(lines))
+            sys.stdout.flush()
+    return records, returncode
+
+
+def get_available_cpus():
+    """Get the ids of the CPU cores that this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def list_benchmarks(module_names, isolate):
+    """Get info on all benchmarks in the given modules."""
+    infos = []
+    for module_name in module_names:
+        if isolate == "none":
+            from _benchmark import collect_benchmarks
+
+            module = import_module(module_name)
+            infos += get_benchmark_infos(module_name, collect_benchmarks(vars(module)))
+        else:
+            results, returncode = run_child(["--child", module_name, "--list"])
+            if returncode:
+                print(f"Failed to collect benchmarks from {module_name}")
+            for result in results:
+                infos.extend(result)
+    return infos
+
+
+def run_benchmarks(infos, isolate, run_id, store, jobs=1, options=None, cpus=None):
+    """Run the given benchmarks. Returns the number of failures.
+
+    If jobs > 1, the CPU-bound benchmarks are distributed over that many
+    worker processes, each pinned to its own core. The GPU-bound benchmarks
+    are always run one at a time, after the CPU-bound ones.
+
+    The cpus are the cores to use (default all available). If given, the
+    GPU-bound benchmarks are pinned to the first of these.
+
+    The options are passed to ``configure()`` in the process that runs
+    the benchmarks. A benchmark that raises is counted as a failure, and
+    the others are still run.
+    """
+    if isolate == "none" and jobs > 1:
+        raise ValueError("Parallel jobs need subprocesses, not isolate='none'.")
+    options = options or {}
+    from _benchmark import configure, OffscreenWgpuCanvas
+    from _store import append_record
+    from _environment import pin_to_cpu
+
+    configure(run_id=run_id, store=store, **options)
+
+    # Group into tasks, one per subprocess
+    tasks = []
+    for info in infos:
+        kind = info["kind"] if jobs > 1 else "gpu"
+        if isolate == "module" and tasks and tasks[-1][:2] == (info["module"], kind):
+            tasks[-1][2].append(info["name"])
+        else:
+            tasks.append((info["module"], kind, [info["name"]]))
+
+    if isolate == "none":
+        if cpus:
+            pin_to_cpu(cpus[0])
+        canvas = OffscreenWgpuCanvas()
+        n_failed = 0
+        for module_name, _, names in tasks:
+            n_failed += run_module_benchmarks(module_name, names, canvas)
+        return n_failed
+
+    store_lock = threading.Lock()
+    free_cpus = list(cpus) if cpus else get_available_cpus()
+    n_failed = 0
+
+    def on_record(record):
+        if store:
+            with store_lock:
+                append_record(record, store)
+
+    def run_task(task, cpu=None, buffer_output=False):
+        nonlocal n_failed
+        module_name, kind, names = task
+        args = ["--child", module_name, "--run-id", run_id]
+        args += ["--config", json.dumps(options)]
+        for name in names:
+            args += ["-k", name]
+        if cpu is not None:
+            args += ["--cpu", str(cpu)]
+        records, returncode = run_child(args, on_record, buffer_output)
+        if returncode:
+            with store_lock:
+                n_failed += len(names) - len(records)
+            print(f"Benchmark process for {module_name} failed ({returncode})")
+
+    def run_task_in_pool(task):
+        with store_lock:
+            cpu = free_cpus.pop()
+        try:
+            run_task(task, cpu, buffer_output=True)
+        finally:
+            with store_lock:
+                free_cpus.append(cpu)
+
+    cpu_tasks = [task for task in tasks if task[1] == "cpu"]
+    gpu_tasks = [task for task in tasks if task[1] == "gpu"]
+
+    if cpu_tasks:
+        n_workers = min(jobs, len(free_cpus))
+        print(f"Running {len(cpu_tasks)} CPU-bound tasks on {n_workers} workers")
+        with ThreadPoolExecutor(n_workers) as executor:
+            list(executor.map(run_task_in_pool, cpu_tasks))
+
+    for task in gpu_tasks:
+        run_task(task, cpus[0] if cpus else None)
+
+    return n_failed
+
+
+def main(argv=None):
+    from _store import DEFAULT_STORE, new_run_id
+
+    parser = argparse.ArgumentParser(description="Run pygfx/wgpu benchmarks.")
+    parser.add_argument(
+        "modules", nargs="*", help="benchmark modules to run (default all)"
+    )
+    parser.add_argument(
+        "-k", dest="patterns", action="append", help="select benchmarks by name glob"
+    )
+    parser.add_argument(
+        "--tag", dest="tags", action="append", help="select benchmarks by tag"
+    )
+    parser.add_argument(
+        "--isolate",
+        choices=["benchmark", "module", "none"],
+        default="benchmark",
+        help="run each benchmark or module in a subprocess, or all in this process",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of parallel workers for CPU-bound benchmarks",
+    )
+    parser.add_argument(
+        "--target-ci",
+        type=float,
+        default=None,
+        help="iterate until the median is known within this fraction (e.g. 0.02)",
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        default=10.0,
+        help="max seconds of measurements per benchmark when using --target-ci",
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=None,
+        help="select and tune benchmarks to fit in this many seconds (see _schedule.py)",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=None,
+        help="use a fixed number of warmup iterations (default until steady)",
+    )
+    parser.add_argument(
+        "--controlled",
+        action="store_true",
+        help="pin to isolated cores, control the GC, and check for interference",
+    )
+    parser.add_argument(
+        "--reject-noisy",
+        action="store_true",
+        help="drop iterations that were interrupted by other processes",
+    )
+    parser.add_argument(
+        "--device",
+        choices=["shared", "fresh", "pooled"],
+        default="shared",
+        help="use a shared device for all benchmarks, a fresh device and canvas "
+        + "for each benchmark, or a device that was left clean by an earlier one",
+    )
+    parser.add_argument(
+        "--memory", action="store_true", help="record memory use per iteration"
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        default=None,
+        help="profile the timed region, writing .pstats and .collapsed files to this "
+        + "directory (default .results/profiles/<run-id>)",
+    )
+    parser.add_argument(
+        "--fixture-budget",
+        type=float,
+        default=2048,
+        help="max MB of cached input arrays per process",
+    )
+    parser.add_argument(
+        "--fixture-dir",
+        nargs="?",
+        const="",
+        default=None,
+        help="memory-map large input arrays from .npy files in this directory, "
+        + "shared between processes (default .results/fixtures)",
+    )
+    parser.add_argument("--list", action="store_true", help="only list benchmarks")
+    parser.add_argument("--store", default=DEFAULT_STORE, help="the result store")
+    parser.add_argument("--no-store", action="store_true", help="don't store results")
+    parser.add_argument("--run-id", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--cpu", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--config", default="{}", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.isolate == "none" and args.jobs > 1:
+        parser.error(
+            "--jobs > 1 needs subprocesses, so it cannot be used with --isolate none"
+        )
+
+    if args.child:
+        from _benchmark import configure
+
+        if args.list:
+            child_list(args.child)
+        else:
+            configure(run_id=args.run_id, stream=True, **json.loads(args.config))
+            if child_run(args.child, set(args.patterns or ()), args.cpu):
+                return 1
+        return 0
+
+    module_names = [os.path.splitext(os.path.basename(m))[0] for m in args.modules]
+    module_names = module_names or discover_modules()
+    infos = list_benchmarks(module_names, args.isolate)
+    infos = select_benchmarks(infos, args.patterns, args.tags)
+
+    if args.list:
+        for info in infos:
+            tags = ", ".join(info["tags"])
+            print(f"{info['module']}: {info['name']} ({info['kind']})  [{tags}]")
+        return 0
+
+    time_budgets = {}
+    if args.budget is not None:
+        from _schedule import get_history, get_changed_files, schedule
+
+        history = get_history(args.store)
+        changed_files = get_changed_files(history)
+        scheduled, time_budgets = schedule(infos, args.budget, history, changed_files)
+        print(f"Scheduled {len(scheduled)} of {len(infos)} benchmarks:")
+        for info, reason in scheduled:
+            print(f"    {info['module']}: {info['name']} ({reason})")
+        infos = [info for info, _ in scheduled]
+
+    run_id = args.run_id or new_run_id()
+    store = None if args.no_store else args.store
+    print(f"Running {len(infos)} benchmarks (run {run_id})")
+    profile_dir = args.profile
+    if profile_dir == "":
+        profile_dir = os.path.join(os.path.dirname(DEFAULT_STORE), "profiles", run_id)
+    fixture_dir = args.fixture_dir
+    if fixture_dir == "":
+        fixture_dir = os.path.join(os.path.dirname(DEFAULT_STORE), "fixtures")
+    target_ci = args.target_ci
+    if time_budgets and target_ci is None:
+        target_ci = 0.01  # spend the budget until the result is this stable
+    options = {
+        "target_ci": target_ci,
+        "time_budget": args.time_budget,
+        "time_budgets": time_budgets,
+        "warmup": args.warmup,
+        "memory": args.memory,
+        "controlled": args.controlled,
+        "reject_noisy": args.reject_noisy,
+        "device": args.device,
+        "profile": profile_dir and os.path.abspath(profile_dir),
+        "fixture_budget": int(args.fixture_budget * 2**20),
+        "fixture_dir": fixture_dir and os.path.abspath(fixture_dir),
+    }
+    cpus = None
+    if args.controlled:
+        from _environment import get_isolated_cpus, check_environment
+
+        cpus = get_isolated_cpus() or get_available_cpus()
+        for warning in check_environment(cpus):
+            print(f"WARNING: {warning}")
+    n_failed = run_benchmarks(
+        infos, args.isolate, run_id, store, args.jobs, options, cpus
+    )
+    if n_failed:
+        print(f"{n_failed} benchmarks failed")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())